@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Usage:
+    render_benchmark.py [--width=<width>] [--height=<height>] [--frames=<frames>] [<workload>...]
+
+Options:
+  -h --help          : Display this help text
+  --width=<width>    : Width of the renderer [default: 120]
+  --height=<height>  : Height of the renderer [default: 40]
+  --frames=<frames>  : Number of frames for every workload [default: 500]
+
+Feeds generated application output into a pane and renders every frame with
+a headless renderer. For every workload, this reports the input throughput,
+the number of frames per second and the number of bytes per frame.
+
+Workloads: log, top, vim, ls. (All of them by default.)
+"""
+from libpymux.panes import Pane
+from libpymux.renderer import NullRenderer
+from libpymux.session import Session
+from libpymux.window import Window
+
+import time
+import docopt
+
+
+class BenchmarkPane(Pane):
+    """ Pane without a process. The output is fed directly to its stream. """
+    process_id = None
+
+
+def log_workload(width, height, frames):
+    """ Log tailing: ten new lines per frame. """
+    for i in range(frames):
+        yield ''.join(
+            '2014-10-01 12:%02i:%02i INFO [worker-%i] GET /api/items/%i 200 handled in %.3fms\r\n' %
+            (i // 60 % 60, i % 60, j, i * 10 + j, (i * j) % 997 / 7.)
+            for j in range(10))
+
+
+def top_workload(width, height, frames):
+    """ `top`-like application: the whole screen is redrawn every frame. """
+    yield '\033[?1049h\033[H\033[2J'
+
+    for i in range(frames):
+        lines = ['\033[H\033[1mtop - up %i min, load average: %.2f\033[0m\033[K' % (i, i % 100 / 10.)]
+
+        for row in range(1, height - 1):
+            lines.append('\033[7m%5i\033[0m root  20   0 %8i %6i S %5.1f %4.1f %s\033[K' % (
+                1000 + row, (row * 7919 + i) % 99999, (row * 31 + i) % 9999,
+                (row + i) % 1000 / 10., row % 100 / 10., 'process-%i' % row))
+
+        yield '\r\n'.join(lines)
+
+
+def vim_workload(width, height, frames):
+    """ Full-screen editor, scrolling one line at a time with a status line. """
+    bottom = height - 2
+    yield '\033[?1049h\033[H\033[2J\033[1;%ir' % (bottom + 1)
+
+    for i in range(frames):
+        yield ('\033[%i;1H\n\033[33m%4i \033[0m    def function_%i(self, value):\033[K'
+               '\033[%i;1H\033[7m"file.py" line %i\033[0m\033[K' % (
+                    bottom + 1, i, i, height, i))
+
+
+def ls_workload(width, height, frames):
+    """ Colour heavy directory listings. """
+    colours = ['01;34', '01;32', '01;36', '00', '01;31', '40;33;01']
+
+    for i in range(frames):
+        lines = []
+        for row in range(5):
+            lines.append('  '.join(
+                '\033[%sm%-14s\033[0m' % (colours[(row + col) % len(colours)], 'file_%i_%i' % (i, col))
+                for col in range(width // 16)))
+        yield '\r\n'.join(lines) + '\r\n'
+
+
+workloads = {
+    'log': log_workload,
+    'top': top_workload,
+    'vim': vim_workload,
+    'ls': ls_workload,
+}
+
+
+def run_workload(workload, width, height, frames):
+    """
+    Render every chunk of this workload as a frame. Return (input bytes,
+    seconds, frames, output bytes).
+    """
+    session = Session()
+    renderer = NullRenderer(width, height)
+    session.add_renderer(renderer)
+
+    window = Window()
+    session.add_window(window)
+    pane = BenchmarkPane()
+    window.add_pane(pane)
+
+    input_bytes = 0
+    start = time.perf_counter()
+
+    for text in workload(width, height, frames):
+        input_bytes += len(text.encode('utf-8'))
+        pane.stream.feed(text)
+        session.invalidate_pane(pane)
+
+        # Render. (None of the coroutines in here wait for anything.)
+        for _ in session.repaint():
+            pass
+
+    duration = time.perf_counter() - start
+    session.close()
+    return input_bytes, duration, renderer.frames, renderer.bytes_written
+
+
+def main():
+    a = docopt.docopt(__doc__)
+    width = int(a['--width'])
+    height = int(a['--height'])
+    frames = int(a['--frames'])
+    names = a['<workload>'] or sorted(workloads)
+
+    print('%-6s %10s %10s %10s %12s' % ('', 'MB/s in', 'frames', 'frames/s', 'bytes/frame'))
+
+    for name in names:
+        input_bytes, duration, frame_count, output_bytes = run_workload(
+                workloads[name], width, height, frames)
+
+        print('%-6s %10.2f %10i %10.1f %12.1f' % (
+            name, input_bytes / duration / 1024 / 1024, frame_count,
+            frame_count / duration, output_bytes / max(frame_count, 1)))
+
+
+if __name__ == '__main__':
+    main()
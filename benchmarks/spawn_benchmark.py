@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Usage:
+    spawn_benchmark.py [--count=<count>]
+
+Options:
+  -h --help          : Display this help text
+  --count=<count>    : Number of panes to spawn [default: 50]
+
+Measures the pane spawn latency: the time between starting a pane and the
+termination of its process, which only runs `/bin/true`. Compares fork+exec
+(`ExecPane`) with posix_spawn (`SpawnPane`).
+"""
+from libpymux.panes import ExecPane, SpawnPane
+
+import asyncio
+import os
+import time
+import docopt
+
+
+class TruePane(ExecPane):
+    def _do_exec(self):
+        os.execv('/bin/true', ['true'])
+
+
+def spawn_true_pane():
+    return SpawnPane(['/bin/true'])
+
+
+@asyncio.coroutine
+def spawn(pane_factory, count):
+    """ Spawn `count` panes, one after each other. Return the latencies. """
+    latencies = []
+
+    for i in range(count):
+        pane = pane_factory()
+
+        start = time.perf_counter()
+        yield from pane.run()
+        latencies.append(time.perf_counter() - start)
+
+        # (The master side is closed by the read transport.)
+        os.close(pane.slave)
+
+    return latencies
+
+
+def main():
+    a = docopt.docopt(__doc__)
+    count = int(a['--count'])
+
+    loop = asyncio.get_event_loop()
+
+    print('%-6s %10s %10s %10s' % ('', 'mean (ms)', 'median', 'max'))
+
+    for name, pane_factory in [('fork', TruePane), ('spawn', spawn_true_pane)]:
+        latencies = loop.run_until_complete(spawn(pane_factory, count))
+        latencies.sort()
+
+        print('%-6s %10.2f %10.2f %10.2f' % (
+            name, sum(latencies) / len(latencies) * 1000,
+            latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,10 +9,9 @@ Options:
 Splits the terminal in several panes, each running "tail -f". Press Ctrl-C in a
 pane to terminal. Make sure that all the files to be monitored exist.
 """
-from asyncio.protocols import BaseProtocol
 from libpymux.input import InputProtocol
-from libpymux.panes import ExecPane
-from libpymux.renderer import PipeRenderer
+from libpymux.panes import SpawnPane
+from libpymux.renderer import OutputProtocol, PipeRenderer
 from libpymux.session import Session
 from libpymux.std import raw_mode
 from libpymux.utils import alternate_screen, call_on_sigwinch
@@ -29,26 +28,23 @@ class OurInputProtocol(InputProtocol):
         return { }
 
 
-class TailPane(ExecPane):
+class TailPane(SpawnPane):
     def __init__(self, filename):
         self.filename = filename
-        super().__init__()
-
-    def _exec(self):
-        os.execv('/usr/bin/tail', ['tail', '-f', self.filename])
+        super().__init__(['tail', '-f', filename])
 
 
 @asyncio.coroutine
 def run(filenames):
     # Output transport/protocol
-    output_transport, output_protocol = yield from loop.connect_write_pipe(BaseProtocol, os.fdopen(0, 'wb'))
+    output_transport, output_protocol = yield from loop.connect_write_pipe(OutputProtocol, os.fdopen(0, 'wb'))
 
     with raw_mode(sys.stdin.fileno()):
         # Enter alternate screen buffer
         with alternate_screen(output_transport.write):
             # Create session and renderer
             session = Session()
-            renderer = PipeRenderer(output_transport.write)
+            renderer = PipeRenderer(output_transport.write, output_transport, output_protocol)
             session.add_renderer(renderer)
 
             # Setup layout
@@ -6,10 +6,9 @@ Usage:
 Doesn't start any external processes. Just runs a Python while loop in the
 panes.
 """
-from asyncio.protocols import BaseProtocol
 from libpymux.input import InputProtocol
 from libpymux.panes import ExecPane
-from libpymux.renderer import PipeRenderer
+from libpymux.renderer import OutputProtocol, PipeRenderer
 from libpymux.session import Session
 from libpymux.std import raw_mode
 from libpymux.utils import alternate_screen, call_on_sigwinch
@@ -47,14 +46,14 @@ def run():
     finish_f = asyncio.Future()
 
     # Output transport/protocol
-    output_transport, output_protocol = yield from loop.connect_write_pipe(BaseProtocol, os.fdopen(0, 'wb'))
+    output_transport, output_protocol = yield from loop.connect_write_pipe(OutputProtocol, os.fdopen(0, 'wb'))
 
     with raw_mode(sys.stdin.fileno()):
         # Enter alternate screen buffer
         with alternate_screen(output_transport.write):
             # Create session and renderer
             session = Session()
-            renderer = PipeRenderer(output_transport.write)
+            renderer = PipeRenderer(output_transport.write, output_transport, output_protocol)
             session.add_renderer(renderer)
 
             # Setup layout
@@ -0,0 +1,110 @@
+"""
+Child process watcher.
+
+Waits for the processes of all the panes in the event loop, instead of
+calling a blocking `waitpid` in an executor thread for every pane. On Linux
+(Python 3.9+), every child gets a pidfd, which becomes readable when the
+process terminates. Otherwise, the child watcher of asyncio reaps them. (A
+SIGCHLD handler of our own would replace that one, and then subprocesses that
+are created through asyncio would never be reaped.)
+"""
+import asyncio
+import os
+
+from .log import logger
+
+
+class ChildWatcher:
+    """
+    Resolves a future for every child process when it terminates.
+    """
+    def __init__(self, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.use_pidfd = hasattr(os, 'pidfd_open')
+
+        self._futures = {} # Maps pid to future.
+        self._pidfds = {} # Maps pid to pidfd.
+
+    def wait(self, pid):
+        """
+        Return a future that is resolved with the exit status (as returned by
+        `os.waitpid`) of this child process. (Waiting again for the same child
+        returns the same future.)
+        """
+        future = self._futures.get(pid)
+        if future is not None and not future.done():
+            return future
+
+        future = asyncio.Future(loop=self.loop)
+        self._futures[pid] = future
+
+        if self.use_pidfd:
+            try:
+                pidfd = os.pidfd_open(pid)
+            except OSError:
+                # Kernel without pidfd support.
+                self.use_pidfd = False
+            else:
+                self._pidfds[pid] = pidfd
+                self.loop.add_reader(pidfd, self._reap, pid)
+
+        if not self.use_pidfd:
+            asyncio.get_child_watcher().add_child_handler(pid, self._on_child_exit)
+
+        return future
+
+    def poll(self, pid):
+        """
+        True when this child terminated. This checks right now, instead of
+        waiting for the event loop. (The child is reaped later.)
+        """
+        try:
+            return os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+        except ChildProcessError:
+            return True # Reaped already.
+
+    def _on_child_exit(self, pid, returncode):
+        """ Called by the asyncio child watcher. """
+        # Turn the return code (negative for a signal) into a `waitpid` status.
+        if returncode < 0:
+            status = -returncode
+        else:
+            status = returncode << 8
+
+        self._resolve(pid, status)
+
+    def _reap(self, pid):
+        """ Call `waitpid` for this child, if it terminated. """
+        try:
+            result_pid, status = os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            # Reaped by someone else. The status is unknown.
+            result_pid, status = pid, 255 << 8
+
+        if result_pid == 0:
+            return # Still running.
+
+        self._resolve(pid, status)
+
+    def _resolve(self, pid, status):
+        """ The child terminated. Stop watching it, and resolve the future. """
+        pidfd = self._pidfds.pop(pid, None)
+        if pidfd is not None:
+            self.loop.remove_reader(pidfd)
+            os.close(pidfd)
+
+        future = self._futures.pop(pid, None)
+        if future and not future.cancelled():
+            logger.info('Child %r terminated, status=%r' % (pid, status))
+            future.set_result(status)
+
+
+_child_watcher = None
+
+
+def get_child_watcher():
+    """ Return the child watcher for the default event loop. """
+    global _child_watcher
+    if _child_watcher is None:
+        _child_watcher = ChildWatcher()
+    return _child_watcher
@@ -1,13 +1,95 @@
 from .log import logger
 from asyncio.protocols import Protocol
+import asyncio
+
+loop = asyncio.get_event_loop()
+
+# Bracketed paste: the terminal sends pasted text between these sequences.
+PASTE_START = b'\033[200~'
+PASTE_END = b'\033[201~'
+
+
+def _key_length(key):
+    """
+    Number of bytes of the key at the start of `key`: an escape sequence, an
+    UTF-8 encoded character or a single byte. None when it continues after
+    the end of `key`.
+    """
+    first = key[0]
+
+    if first == 0x1b:
+        if len(key) < 2:
+            return None
+
+        if key[1:2] == b'[':
+            # CSI: parameter and intermediate bytes, ending with a final byte.
+            for i in range(2, len(key)):
+                if 0x40 <= key[i] <= 0x7e:
+                    return i + 1
+            return None if len(key) < 32 else len(key)
+
+        if key[1:2] == b'O':
+            # SS3: one more byte, like the function keys.
+            return 3 if len(key) >= 3 else None
+
+        return 2 # Meta + key.
+
+    if first >= 0xc0:
+        length = 2 if first < 0xe0 else 3 if first < 0xf0 else 4
+        return length if len(key) >= length else None
+
+    return 1
 
 
 class InputProtocol(Protocol):
+    """
+    Reads the keyboard input of a client.
+
+    Input is sent to the active pane, except for key bindings: the prefix
+    key, followed by one of the keys returned by `get_bindings`. These keys
+    can consist of several bytes, like the escape sequences for arrow and
+    function keys. Pasted text (when the client terminal is in bracketed paste
+    mode) is written to the pane as a whole, without looking for bindings.
+    """
+    prefix = b'\x01' # Ctrl-A
+
+    # When the bytes received so far after the prefix form a binding, but
+    # also the beginning of a longer one (e.g. Escape versus an arrow key),
+    # wait this long for more input before calling the shorter binding.
+    ambiguous_timeout = .05
+
     def __init__(self, session):
         self.session = session
 
-        self._input_parser_generator = self._input_parser()
-        self._input_parser_generator.send(None)
+        self._trie = self._create_trie(self.get_bindings())
+        self._node = None # Position in the trie, when the prefix was typed.
+        self._key = b'' # Bytes typed after the prefix.
+        self._unbound_key = b'' # Beginning of an unbound key, that's skipped.
+        self._timeout_handle = None
+        self._send_buffer = []
+
+        # Bracketed paste state.
+        self._start_tail = b'' # Possible beginning of PASTE_START.
+        self._paste_pane = None # Pane that receives the paste.
+        self._paste_bracketed = False # Pane application wants bracketed paste.
+        self._paste_tail = b'' # Possible beginning of PASTE_END.
+
+    @staticmethod
+    def _create_trie(bindings):
+        """
+        Create a trie of the key bindings. Every node is a dictionary that
+        maps the next byte (as a bytes object) to the next node. The handler
+        of the keys that end in a node is stored under `None`.
+        """
+        trie = {}
+
+        for keys, handler in bindings.items():
+            node = trie
+            for i in range(len(keys)):
+                node = node.setdefault(keys[i:i+1], {})
+            node[None] = handler
+
+        return trie
 
     def connection_made(self, transport):
         self.transport = transport
@@ -15,37 +97,213 @@ class InputProtocol(Protocol):
     def data_received(self, data):
         self._process_input(data)
 
-    def _process_input(self, char):
-        logger.info('Received input: %r' % char)
-        self._send_buffer = []
+    def _process_input(self, data):
+        logger.info('Received %i bytes of input' % len(data))
 
-        for c in char:
-            self._input_parser_generator.send(bytes((c,)))
+        if self._timeout_handle:
+            self._timeout_handle.cancel()
+            self._timeout_handle = None
 
-        if self._send_buffer:
-            self.session.send_input_to_current_pane(self._send_buffer)
+        # The end of the previous chunk could be the beginning of a paste.
+        if self._start_tail:
+            data = self._start_tail + data
+            self._start_tail = b''
 
-        self._send_buffer = []
+        i = 0
+        length = len(data)
 
-    def send_input_to_current_pane(self, data):
-        self._send_buffer.append(data)
+        # Skip the rest of an unbound key.
+        if self._unbound_key:
+            key = self._unbound_key + data
+            key_length = _key_length(key)
 
-    def _input_parser(self):
-        bindings = self.get_bindings()
+            if key_length is None:
+                self._unbound_key = key
+                i = length
+            else:
+                i = key_length - len(self._unbound_key)
+                self._unbound_key = b''
+
+        while i < length:
+            if self._paste_pane is not None:
+                i = self._process_paste(data, i)
+
+            elif self._node is None:
+                # Forward everything until the next prefix or paste as one slice.
+                index = data.find(self.prefix, i)
+                paste_index = data.find(PASTE_START, i, index if index != -1 else length)
+
+                if paste_index != -1:
+                    if paste_index > i:
+                        self.send_input_to_current_pane(data[i:paste_index])
 
-        while True:
-            char = yield
+                    i = paste_index + len(PASTE_START)
+                    self._start_paste()
 
-            if char == b'\x01': # Ctrl-A
-                logger.info('Received CTRL-A')
+                elif index == -1:
+                    # Keep what could be the beginning of a paste.
+                    end = length
+                    escape = data.rfind(PASTE_START[:1], max(i, end - len(PASTE_START) + 1))
+                    if escape != -1 and PASTE_START.startswith(data[escape:]):
+                        self._start_tail = data[escape:]
+                        end = escape
 
-                c2 = yield
+                    if end > i:
+                        self.send_input_to_current_pane(data[i:end])
+                    break
 
-                handler = bindings.get(c2, None)
-                if handler:
-                    handler()
+                else:
+                    if index > i:
+                        self.send_input_to_current_pane(data[i:index])
+
+                    i = index + len(self.prefix)
+                    self._node = self._trie
+                    self._key = b''
             else:
-                self.send_input_to_current_pane(char)
+                child = self._node.get(data[i:i+1])
+
+                if child is not None:
+                    self._key += data[i:i+1]
+                    i += 1
+                    self._node = child
+
+                    # End of the longest possible key.
+                    if len(child) == 1 and None in child:
+                        self._call_binding()
+
+                elif None in self._node:
+                    # This byte doesn't continue the key. Call the binding of
+                    # the bytes so far. The byte is processed again as normal
+                    # input.
+                    self._call_binding()
+                else:
+                    i = self._skip_unbound_key(data, i)
+
+        self._flush()
+
+        # Wait for the rest of the key or paste sequence. (A lone Escape key
+        # is sent after the timeout.)
+        if (self._start_tail or self._unbound_key or
+                (self._node is not None and self._node is not self._trie)):
+            self._timeout_handle = loop.call_later(self.ambiguous_timeout, self._on_timeout)
+
+    def _start_paste(self):
+        """
+        The client terminal starts sending pasted text. It goes to the active
+        pane as-is, without looking for key bindings.
+        """
+        self._flush()
+
+        pane = self.session.active_pane
+        if pane:
+            self._paste_pane = pane
+            self._paste_bracketed = pane.bracketed_paste
+            self._paste_tail = b''
+
+            if self._paste_bracketed:
+                self.session.send_paste_to_pane(pane, PASTE_START)
+
+    def _process_paste(self, data, i):
+        """
+        Write pasted data, starting at index `i`, to the pane. Return the index
+        after the paste, or the length of the data when the paste continues.
+        """
+        pane = self._paste_pane
+        view = memoryview(data)
+
+        # The end of the previous chunk could be the beginning of the end
+        # sequence.
+        if self._paste_tail:
+            rest = PASTE_END[len(self._paste_tail):]
+
+            if data.startswith(rest, i):
+                self._end_paste()
+                return i + len(rest)
+
+            if rest.startswith(data[i:]):
+                self._paste_tail += data[i:]
+                return len(data)
+
+            self.session.send_paste_to_pane(pane, self._paste_tail)
+            self._paste_tail = b''
+
+        index = data.find(PASTE_END, i)
+
+        if index != -1:
+            if index > i:
+                self.session.send_paste_to_pane(pane, view[i:index])
+            self._end_paste()
+            return index + len(PASTE_END)
+
+        # Keep what could be the beginning of the end sequence.
+        end = len(data)
+        escape = data.rfind(PASTE_END[:1], max(i, end - len(PASTE_END) + 1))
+        if escape != -1 and PASTE_END.startswith(data[escape:]):
+            self._paste_tail = data[escape:]
+            end = escape
+
+        if end > i:
+            self.session.send_paste_to_pane(pane, view[i:end])
+
+        return len(data)
+
+    def _end_paste(self):
+        if self._paste_bracketed:
+            self.session.send_paste_to_pane(self._paste_pane, PASTE_END)
+
+        self._paste_pane = None
+        self._paste_tail = b''
+
+    def _skip_unbound_key(self, data, i):
+        """
+        The key that was typed after the prefix, ending with `data[i]`, isn't
+        bound. Drop all of it, including the rest of an escape sequence. (So
+        that none of it ends up in the pane.) Return the index after the key.
+        """
+        typed = len(self._key)
+        key = self._key + data[i:]
+        key_length = _key_length(key)
+
+        self._node = None
+        self._key = b''
+
+        if key_length is None:
+            # The key continues in the next chunk.
+            self._unbound_key = key
+            return len(data)
+
+        return i + max(0, key_length - typed)
+
+    def _call_binding(self):
+        """ Call the handler of the current trie node (if any) and reset. """
+        handler = self._node.get(None)
+        self._node = None
+
+        if handler:
+            # Input before the binding goes to the pane that was active.
+            self._flush()
+            handler()
+
+    def _on_timeout(self):
+        self._timeout_handle = None
+
+        if self._start_tail:
+            self.send_input_to_current_pane(self._start_tail)
+            self._start_tail = b''
+        elif self._unbound_key:
+            self._unbound_key = b''
+        else:
+            self._call_binding()
+
+        self._flush()
+
+    def _flush(self):
+        if self._send_buffer:
+            self.session.send_input_to_current_pane(self._send_buffer)
+            self._send_buffer = []
+
+    def send_input_to_current_pane(self, data):
+        self._send_buffer.append(data)
 
     def get_bindings(self):
         return {
@@ -1,17 +1,20 @@
 
 import asyncio
+import codecs
 import resource
-import pyte
 import os
 import io
 import signal
+import warnings
 
+from .childwatcher import get_child_watcher
 from .log import logger
 from .utils import set_size
 from .pexpect_utils import pty_make_controlling_tty
+from .ptywriter import PtyWriter
 from .layout import Container, Location
 from .screen import BetterScreen
-from .invalidate import Redraw
+from .stream import BetterStream
 
 loop = asyncio.get_event_loop()
 
@@ -62,10 +65,42 @@ class BorderType:
     TopLeft = Position.Right | Position.Bottom
 
 
+# Maps the CellPosition of a cell relative to a pane to the BorderType.
+_border_types = {
+    CellPosition.TopBorder: BorderType.Horizontal,
+    CellPosition.BottomBorder: BorderType.Horizontal,
+    CellPosition.LeftBorder: BorderType.Vertical,
+    CellPosition.RightBorder: BorderType.Vertical,
+
+    CellPosition.TopLeftBorder: BorderType.TopLeft,
+    CellPosition.TopRightBorder: BorderType.TopRight,
+    CellPosition.BottomLeftBorder: BorderType.BottomLeft,
+    CellPosition.BottomRightBorder: BorderType.BottomRight,
+
+    CellPosition.Inside: BorderType.Inside,
+    CellPosition.Outside: BorderType.Outside,
+}
+
 
 class Pane(Container):
     _counter = 0
 
+    # Maximum number of lines that are kept in the scrollback history.
+    history_limit = 2000
+
+    # Encoding of the application output, and how to handle invalid input.
+    # (See `codecs` for the possible error handlers.)
+    encoding = 'utf-8'
+    decode_errors = 'replace'
+
+    # Flood control: when processing the output of the application took more
+    # than `flood_time_limit` seconds within `flood_interval` seconds, reading
+    # from the pseudo terminal is paused for the rest of the interval, and the
+    # pane is only redrawn when reading resumes. (This scales with the cost of
+    # the output: plain text that's processed fast is never throttled.)
+    flood_time_limit = .025
+    flood_interval = .05
+
     def __init__(self):
         super().__init__()
 
@@ -82,8 +117,8 @@ class Pane(Container):
         self.location = Location(self.py, self.py, self.sx, self.sy)
 
         # Create output stream and attach to screen
-        self.screen = BetterScreen(self.sx, self.sy)
-        self.stream = pyte.Stream()
+        self.screen = BetterScreen(self.sx, self.sy, history_limit=self.history_limit)
+        self.stream = BetterStream()
         self.stream.attach(self.screen)
 
         # Create pseudo terminal for this pane.
@@ -94,6 +129,20 @@ class Pane(Container):
 
         self.id = self._next_id()
 
+        # Buffered writers for both sides of the pty. (Created when needed.)
+        self._input_writer = None
+        self._output_writer = None
+        self._writers_closed = False
+
+        # Flood control state.
+        self._flood_start = 0
+        self._flood_time = 0
+        self._reading_paused = False
+
+        # Flood control statistics.
+        self.paused_reads = 0 # Number of times that reading was paused.
+        self.deferred_frames = 0 # Number of redraws that were postponed.
+
     @classmethod
     def _next_id(cls):
         cls._counter += 1
@@ -102,12 +151,13 @@ class Pane(Container):
     def invalidate(self):
         """
         Invalidate session when this pane is in the active window.
+        Only this pane will be redrawn.
         """
         window = self.window()
         if window:
             session = window.session()
             if session.active_window == window:
-                window.invalidate(Redraw.Panes)
+                window.invalidate_pane(self)
 
     @property
     def panes(self):
@@ -130,6 +180,11 @@ class Pane(Container):
         self.screen.resize(self.sy, self.sx)
         set_size(self.slave, self.sy, self.sx)
 
+        # The borders have moved.
+        window = self.window() if self.window else None
+        if window:
+            window.invalidate_border_map()
+
         self.invalidate()
 
     @asyncio.coroutine
@@ -139,55 +194,137 @@ class Pane(Container):
         try:
             def output(data):
                 """ Write data received from the application into the pane and rerender. """
-                self.stream.feed(data)
-                self.invalidate()
+                self._process_output(data, read_transport)
 
             # Master side -> attached to terminal emulator.
             pty_out = io.open(self.master, 'rb', 0)
 
             # Connect read pipe to process
             read_transport, read_protocol = yield from loop.connect_read_pipe(
-                                lambda:SubProcessProtocol(output), pty_out)
+                                lambda:SubProcessProtocol(output, self.encoding, self.decode_errors),
+                                pty_out)
 
             # Run process in executor, wait for that to finish.
             yield from self.run_application()
 
-            # Set finished.
+            # Set finished. (The read transport closed the master side.)
             self.finished = True # TODO: close pseudo terminal.
+            self.close_writers()
         except Exception as e:
             logger.error('CRASH: ' + repr(e))
 
+    def _process_output(self, data, read_transport):
+        """
+        Feed application output to the screen. Apply flood control.
+        """
+        now = loop.time()
+        if now - self._flood_start > self.flood_interval:
+            self._flood_start = now
+            self._flood_time = 0
+
+        self.stream.feed(data)
+
+        self._flood_time += loop.time() - now
+
+        if self._flood_time > self.flood_time_limit:
+            # Too much output. Stop reading until the end of this interval,
+            # so that keyboard input and other panes are not starved, and
+            # skip the intermediate redraws.
+            self.deferred_frames += 1
+
+            if not self._reading_paused:
+                self._reading_paused = True
+                self.paused_reads += 1
+                read_transport.pause_reading()
+
+                loop.call_at(self._flood_start + self.flood_interval,
+                             lambda: self._resume_reading(read_transport))
+        else:
+            self.invalidate()
+
+    def _resume_reading(self, read_transport):
+        """ Resume reading after a flood interval. Redraw the final state. """
+        self._reading_paused = False
+        self._flood_start = loop.time()
+        self._flood_time = 0
+
+        try:
+            read_transport.resume_reading()
+        except (RuntimeError, OSError):
+            # Transport was closed in the meantime.
+            pass
+
+        self.invalidate()
+
     @asyncio.coroutine
     def run_application(self):
         raise NotImplementedError
 
+    @property
+    def input_writer(self):
+        """ `PtyWriter` for the master side of the pty. """
+        if self._input_writer is None:
+            self._input_writer = PtyWriter(self.master)
+        return self._input_writer
+
+    @property
+    def output_writer(self):
+        """ `PtyWriter` for the slave side of the pty. """
+        if self._output_writer is None:
+            # Open the slave again, so that the application doesn't share the
+            # non-blocking flag with us.
+            fd = os.open(os.ttyname(self.slave), os.O_WRONLY | os.O_NOCTTY)
+            self._output_writer = PtyWriter(fd)
+        return self._output_writer
+
+    @property
+    def bracketed_paste(self):
+        """ True when the application enabled bracketed paste mode. """
+        return (2004 << 5) in self.screen.mode
+
     def write_input(self, data):
-        """ Write user key strokes to the input. """
-        os.write(self.master, data)
+        """ Write user key strokes to the input. (Buffered, never blocks.) """
+        if not self._writers_closed:
+            self.input_writer.write(data)
 
     def write(self, data):
         """ Write to stdout of this pane (writes to the slave side of the pty). """
-        os.write(self.slave, data)
+        if not self._writers_closed:
+            self.output_writer.write(data)
+
+    def close_writers(self):
+        """
+        Stop both writers, and close the slave descriptor that was opened for
+        the output writer. (Writing afterwards is ignored.)
+        """
+        if not self._writers_closed:
+            self._writers_closed = True
+
+            if self._input_writer:
+                self._input_writer.close()
+
+            if self._output_writer:
+                self._output_writer.close()
+                os.close(self._output_writer.fd)
 
     @property
     def cursor_position(self):
         return self.screen.cursor.y, self.screen.cursor.x
 
     def _get_border_type(self, x, y):
-        return {
-            CellPosition.TopBorder: BorderType.Horizontal,
-            CellPosition.BottomBorder: BorderType.Horizontal,
-            CellPosition.LeftBorder: BorderType.Vertical,
-            CellPosition.RightBorder: BorderType.Vertical,
+        return _border_types[self._get_cell_position(x,y)]
 
-            CellPosition.TopLeftBorder: BorderType.TopLeft,
-            CellPosition.TopRightBorder: BorderType.TopRight,
-            CellPosition.BottomLeftBorder: BorderType.BottomLeft,
-            CellPosition.BottomRightBorder: BorderType.BottomRight,
+    def get_border_cells(self):
+        """
+        Yield the (x, y) coordinates of the cells that surround this pane.
+        """
+        for x in range(self.px - 1, self.px + self.sx + 1):
+            yield x, self.py - 1
+            yield x, self.py + self.sy
 
-            CellPosition.Inside: BorderType.Inside,
-            CellPosition.Outside: BorderType.Outside,
-        }[ self._get_cell_position(x,y) ]
+        for y in range(self.py, self.py + self.sy):
+            yield self.px - 1, y
+            yield self.px + self.sx, y
 
     def is_inside(self, x, y):
         """ True when this coordinate appears inside this pane. """
@@ -229,19 +366,43 @@ class Pane(Container):
 
 
 class SubProcessProtocol(asyncio.protocols.SubprocessProtocol):
-    def __init__(self, write_output):
+    """
+    Protocol that decodes the output of the pseudo terminal and passes it to
+    `write_output`.
+
+    An incremental decoder is used: a multibyte character that is split over
+    two reads is kept until the rest of it arrives.
+    """
+    def __init__(self, write_output, encoding='utf-8', errors='replace'):
         self._write_output = write_output
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors)
         super().__init__()
 
     def data_received(self, data):
-        self._write_output(data.decode('utf-8'))
+        text = self._decoder.decode(data)
+        if text:
+            self._write_output(text)
+
+    def connection_lost(self, exc):
+        # Flush incomplete sequences at the end of the stream.
+        text = self._decoder.decode(b'', final=True)
+        if text:
+            self._write_output(text)
 
 
 class ExecPane(Pane):
+    """
+    :param pane_executor: Deprecated and unused. (The process is awaited in
+                          the event loop now, not in an executor.)
+    """
     def __init__(self, pane_executor=None):
         super().__init__()
 
+        if pane_executor is not None:
+            warnings.warn('The pane_executor argument of ExecPane is not used anymore.',
+                          DeprecationWarning, stacklevel=2)
         self.pane_executor = pane_executor
+
         self.finished = False
         self.process_id = None
         self._started = False
@@ -249,18 +410,27 @@ class ExecPane(Pane):
     @asyncio.coroutine
     def run_application(self):
         """
-        Fork this process. The child gets attached to the slave side of the
-        pseudo terminal.
+        Fork this process, unless that happened already (see `start_process`),
+        and wait for it to terminate.
         """
-        logger.info('Forking.')
-        pid = os.fork()
-        if pid == 0: # TODO: <0 is fail
-            yield from self._in_child()
+        self.start_process()
+        yield from self._in_parent(self.process_id)
 
-        elif pid > 0:
-            yield from self._in_parent(pid)
+    def start_process(self):
+        """
+        Fork this process. The child gets attached to the slave side of the
+        pseudo terminal. (This can be called before the pane is displayed, see
+        `ShellPool`.)
+        """
+        if self.process_id is None:
+            logger.info('Forking.')
+            pid = os.fork()
+            if pid == 0: # TODO: <0 is fail
+                self._in_child()
+            else:
+                logger.info('Forked process: %r' % pid)
+                self.process_id = pid
 
-    @asyncio.coroutine
     def _in_child(self):
         os.close(self.master)
 
@@ -280,11 +450,13 @@ class ExecPane(Pane):
 
     @asyncio.coroutine
     def _in_parent(self, pid):
-        logger.info('Forked process: %r' % pid)
-        self.process_id = pid
+        # The status bar displays the process ID.
+        window = self.window() if self.window else None
+        if window:
+            window.invalidate_status_bar()
 
-        # Call waitpid in parent. (waitpid is blocking -> use executor.)
-        pid, status = yield from loop.run_in_executor(self.pane_executor, os.waitpid, pid, 0)
+        # Wait for the process to terminate.
+        status = yield from get_child_watcher().wait(pid)
         logger.info('Process ended, status=%r' % status)
 
     def kill_process(self, sig=signal.SIGKILL):
@@ -307,14 +479,68 @@ class ExecPane(Pane):
         # (In case that we keep running Python code. We shouldn't close them.
         # because the garbage collector is still active, and he will close them
         # eventually.)
-        max_fd = resource.getrlimit(resource.RLIMIT_NOFILE)[-1]
-        for i in range(3, max_fd):
-            if i != self.slave:
-                try:
-                    os.close(i)
-                except OSError:
-                    pass
+        # Only visit the descriptors that are actually open, when the system
+        # can tell us which ones. The hard limit can be very high.
+        try:
+            fds = [int(fd) for fd in os.listdir('/proc/self/fd')]
+        except OSError:
+            fds = None
+
+        if fds is not None:
+            for i in fds:
+                if i > 2 and i != self.slave:
+                    try:
+                        os.close(i)
+                    except OSError:
+                        pass # (The descriptor of the directory listing.)
+        else:
+            # `closerange` uses the close_range system call, when available.
+            max_fd = resource.getrlimit(resource.RLIMIT_NOFILE)[-1]
+            os.closerange(3, self.slave)
+            os.closerange(self.slave + 1, max_fd)
 
     def _do_exec(self):
         raise NotImplementedError
 
+
+class SpawnPane(ExecPane):
+    """
+    Pane that runs an external command. The process is created with
+    `os.posix_spawn` instead of fork+exec, so that no page tables have to be
+    copied and no Python code runs in the child. (Falls back to fork+exec
+    when `posix_spawn` is not available.)
+
+    :param command: List of arguments. The first one is looked up in $PATH.
+    :param env: Environment variables. (Defaults to `os.environ`.)
+    """
+    def __init__(self, command, env=None):
+        super().__init__()
+        self.command = command
+        self.env = env
+
+    def start_process(self):
+        if self.process_id is None and hasattr(os, 'posix_spawnp'):
+            # Become session leader, and open the slave as the first terminal,
+            # which makes it the controlling terminal. (The other descriptors
+            # are not inheritable.)
+            file_actions = [
+                (os.POSIX_SPAWN_OPEN, 0, os.ttyname(self.slave), os.O_RDWR, 0),
+                (os.POSIX_SPAWN_DUP2, 0, 1),
+                (os.POSIX_SPAWN_DUP2, 0, 2),
+            ]
+
+            self.process_id = os.posix_spawnp(
+                self.command[0], self.command,
+                os.environ if self.env is None else self.env,
+                file_actions=file_actions, setsid=True)
+
+            logger.info('Spawned process: %r' % self.process_id)
+        else:
+            super().start_process()
+
+    def _do_exec(self):
+        if self.env is None:
+            os.execvp(self.command[0], self.command)
+        else:
+            os.execvpe(self.command[0], self.command, self.env)
+
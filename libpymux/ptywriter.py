@@ -0,0 +1,118 @@
+"""
+Non-blocking, buffered writer for pseudo terminals.
+
+Writing directly to a pseudo terminal blocks the event loop when the
+application on the other side stops reading. `PtyWriter` writes what the
+terminal accepts, buffers the remainder, and writes it when the file
+descriptor becomes writable again.
+"""
+import asyncio
+import fcntl
+import os
+
+from .log import logger
+
+
+class PtyWriter:
+    """
+    :param fd: The file descriptor. It is put in non-blocking mode.
+    """
+    # When more than `high_watermark` bytes are buffered, the writer is
+    # paused: `drain` waits until the buffer drained below `low_watermark`.
+    high_watermark = 64 * 1024
+    low_watermark = 16 * 1024
+
+    # Data that doesn't fit in the buffer anymore is dropped.
+    max_buffer_size = 16 * 1024 * 1024
+
+    def __init__(self, fd, loop=None):
+        self.fd = fd
+        self.loop = loop or asyncio.get_event_loop()
+
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        self._buffer = bytearray()
+        self._drain_waiters = []
+        self._closed = False
+
+        # Statistics.
+        self.dropped_bytes = 0
+
+    @property
+    def buffered_bytes(self):
+        """ Number of bytes that are waiting to be written. """
+        return len(self._buffer)
+
+    @property
+    def paused(self):
+        """ True when writers should wait for `drain`. """
+        return len(self._buffer) > self.high_watermark
+
+    def write(self, data):
+        """ Write data. This never blocks. """
+        if self._closed:
+            return
+
+        if not self._buffer:
+            # Try to write immediately.
+            written = self._write(data)
+            if written == len(data):
+                return
+
+            data = memoryview(data)[written:]
+            self.loop.add_writer(self.fd, self._write_buffer)
+
+        space = self.max_buffer_size - len(self._buffer)
+        if len(data) > space:
+            logger.warning('Buffer of fd %i is full, dropped %i bytes' % (self.fd, len(data) - space))
+            self.dropped_bytes += len(data) - space
+            data = data[:space]
+
+        self._buffer.extend(data)
+
+    @asyncio.coroutine
+    def drain(self):
+        """ Wait until the buffer drained below the low watermark. """
+        if self.paused:
+            future = asyncio.Future(loop=self.loop)
+            self._drain_waiters.append(future)
+            yield from future
+
+    def close(self):
+        """ Stop writing. Discard the buffer. """
+        if self._buffer:
+            self.loop.remove_writer(self.fd)
+            self._buffer = bytearray()
+
+        self._closed = True
+        self._wake_drain_waiters()
+
+    def _write(self, data):
+        """ Write as much as possible. Return the number of bytes written. """
+        try:
+            return os.write(self.fd, data)
+        except BlockingIOError:
+            return 0
+        except OSError as e:
+            # The application terminated.
+            logger.info('Writing to fd %i failed: %r' % (self.fd, e))
+            self.close()
+            return len(data)
+
+    def _write_buffer(self):
+        """ Called when the file descriptor is writable. """
+        written = self._write(self._buffer)
+        del self._buffer[:written]
+
+        if not self._buffer:
+            self.loop.remove_writer(self.fd)
+
+        if len(self._buffer) <= self.low_watermark:
+            self._wake_drain_waiters()
+
+    def _wake_drain_waiters(self):
+        for future in self._drain_waiters:
+            if not future.done():
+                future.set_result(None)
+        self._drain_waiters = []
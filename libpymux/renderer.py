@@ -4,12 +4,14 @@ import asyncio
 import fcntl
 import pyte
 import datetime
-from collections import namedtuple
+from asyncio.protocols import BaseProtocol
+from collections import namedtuple, defaultdict
 
-from .utils import get_size
+from .utils import get_size, has_terminal_capability
 from .log import logger
 from .panes import CellPosition, BorderType
 from .invalidate import Redraw
+from .screen import styles, Cell, ScreenChanges, shift_lines
 
 loop = asyncio.get_event_loop()
 
@@ -38,49 +40,452 @@ BorderSymbols = {
 reverse_colour_code = dict((v, k) for k, v in pyte.graphics.FG.items())
 reverse_bgcolour_code = dict((v, k) for k, v in pyte.graphics.BG.items())
 
+# Text attributes: (name, SGR code to set, SGR code to unset.)
+_text_attributes = [
+    ('bold', '1', '22'),
+    ('italics', '3', '23'),
+    ('underscore', '4', '24'),
+    ('strikethrough', '9', '29'),
+    ('reverse', '7', '27'),
+]
+
+
+# Encoded characters.
+_glyphs = {}
+
+# Encoded SGR sequences for going from one style id to another.
+_style_transitions = {}
+
+
+def _glyph(data):
+    """ Return the UTF-8 encoding of this character. (Cached.) """
+    try:
+        return _glyphs[data]
+    except KeyError:
+        result = _glyphs[data] = data.encode('utf-8')
+        return result
+
+
+def _csi(count, command):
+    """ CSI sequence with a numeric parameter. (Omitted when it's one.) """
+    if count == 1:
+        return '\033[%s' % command
+    else:
+        return '\033[%i%s' % (count, command)
+
+
+def _fg_code(fg):
+    colour_code = reverse_colour_code.get(fg, None)
+    if colour_code:
+        return str(colour_code)
+    else: # 256 colour
+        return '38;5;%i' % (fg - 1024)
+
+
+def _bg_code(bg):
+    colour_code = reverse_bgcolour_code.get(bg, None)
+    if colour_code:
+        return str(colour_code)
+    else: # 256 colour
+        return '48;5;%i' % (bg - 1024)
+
+
+# White dots on a brown background, for the area outside the session.
+_background_style = styles.get_id(pyte.screens.Char(' ', fg='white', bg='brown'))
+
+
+class OutputEncoder:
+    """
+    Generates the escape sequences for drawing cells, while keeping track of
+    the cursor position and the graphic rendition of the terminal, so that
+    it can always pick the shortest sequence. The output is written UTF-8
+    encoded in the `data` bytearray.
+
+    It assumes that the terminal starts with an unknown cursor position and
+    with the attributes of the given style.
+
+    :param width: Width of the terminal.
+    :param use_rep: Use REP for repeated characters.
+    :param use_erase: Use ECH and EL for runs of blank characters.
+    """
+    def __init__(self, width, style=0, use_rep=False, use_erase=True):
+        self.width = width
+        self.use_rep = use_rep
+        self.use_erase = use_erase
+
+        self.data = bytearray()
+        self.row = None # None means unknown.
+        self.col = None
+        self.style = style
+
+    def move_to(self, row, col):
+        """ Move the cursor to this position. """
+        if row == self.row and col == self.col:
+            return
+
+        write = self.data.extend
+
+        # Absolute position.
+        if col == 0:
+            best = '\033[%iH' % (row + 1)
+        else:
+            best = '\033[%i;%iH' % (row + 1, col + 1)
+
+        # Relative movements.
+        if self.row is not None and self.col is not None:
+            dy = row - self.row
+
+            if dy == 1 and col == 0:
+                candidates = ['\r\n']
+            else:
+                if dy == 0:
+                    vertical = ''
+                elif dy > 0:
+                    vertical = _csi(dy, 'B')
+                else:
+                    vertical = _csi(-dy, 'A')
+
+                horizontal = ['\033[%iG' % (col + 1)]
+                if col == self.col:
+                    horizontal.append('')
+                elif col == 0:
+                    horizontal.append('\r')
+                elif col > self.col:
+                    horizontal.append(_csi(col - self.col, 'C'))
+                else:
+                    horizontal.append(_csi(self.col - col, 'D'))
+
+                candidates = [vertical + h for h in horizontal]
+
+            for c in candidates:
+                if len(c) < len(best):
+                    best = c
+
+        write(best.encode('ascii'))
+        self.row = row
+        self.col = col
+
+    def set_style(self, style_id):
+        """ Set the graphic rendition for this style. """
+        if style_id == self.style:
+            return
+
+        key = (self.style, style_id)
+        try:
+            self.data.extend(_style_transitions[key])
+        except KeyError:
+            sequence = _style_transitions[key] = self._get_style_transition(style_id)
+            self.data.extend(sequence)
+
+        self.style = style_id
+
+    def _get_style_transition(self, style_id):
+        """ Create the SGR sequence for going to this style. """
+        old = styles[self.style]
+        new = styles[style_id]
+
+        # Either only send what changed, or reset and send everything that's
+        # not default. Use whichever is shorter.
+        changes = []
+        for name, on, off in _text_attributes:
+            value = getattr(new, name)
+            if value != getattr(old, name):
+                changes.append(on if value else off)
+        if new.fg != old.fg:
+            changes.append(_fg_code(new.fg))
+        if new.bg != old.bg:
+            changes.append(_bg_code(new.bg))
+
+        reset = ['0']
+        for name, on, off in _text_attributes:
+            if getattr(new, name):
+                reset.append(on)
+        if new.fg != 'default':
+            reset.append(_fg_code(new.fg))
+        if new.bg != 'default':
+            reset.append(_bg_code(new.bg))
+
+        changes = ';'.join(changes)
+        reset = ';'.join(reset)
+
+        return ('\033[%sm' % (changes if len(changes) < len(reset) else reset)).encode('ascii')
+
+    def write_cells(self, row, col, cell, count):
+        """ Draw `count` times the same cell, starting at this position. """
+        self.move_to(row, col)
+        self.set_style(cell.style)
+        write = self.data.extend
+
+        # Runs of blanks: erase instead. (Only without background colour or
+        # visible attributes, because not all terminals erase using the
+        # current attributes.)
+        if cell.data == ' ' and count > 1 and self.use_erase:
+            attrs = styles[cell.style]
+            if (attrs.bg == 'default' and not attrs.reverse and
+                    not attrs.underscore and not attrs.strikethrough):
+                if col + count >= self.width:
+                    write(b'\033[K') # Erase to end of line.
+                    return
+
+                ech = _csi(count, 'X')
+                if len(ech) + len(_csi(count, 'C')) < count:
+                    write(ech.encode('ascii')) # Erase characters. (Cursor stays.)
+                    return
+
+        glyph = _glyph(cell.data)
+        write(glyph)
+        remaining = count - 1
+
+        if remaining and self.use_rep:
+            rep = _csi(remaining, 'b')
+            if len(rep) < remaining * len(glyph):
+                write(rep.encode('ascii'))
+                remaining = 0
+
+        if remaining:
+            write(glyph * remaining)
+
+        self.col += count
+
+        # After writing in the last column, terminals differ in where the
+        # cursor is. Consider it unknown.
+        if self.col >= self.width:
+            self.row = self.col = None
+
+
 
 class Renderer:
+    # Output optimizations. Not every terminal supports REP (the Linux console
+    # doesn't, for instance), so it's only used when the terminal says so.
+    # Disable `use_erase` when the client terminal doesn't support ECH.
+    use_rep = False
+    use_erase = True
+
+    # Wrap every frame in a synchronized update (DEC private mode 2026), so
+    # that the terminal doesn't paint half-finished frames. Terminals that
+    # don't know this mode ignore it.
+    use_synchronized_update = True
+
+    # Write buffer limits (in bytes.) When more than `high_watermark` bytes
+    # are waiting to be sent to the client, the transport pauses writing and
+    # frames are skipped until the buffer drained below `low_watermark`. Then
+    # only the latest state is sent.
+    high_watermark = 64 * 1024
+    low_watermark = 16 * 1024
+
     def __init__(self):
         # Invalidate state
         self.session = None # Weakref set by session.add_renderer
         self._last_size = None
 
+        # What this client received: {pane: {line: {column: Cell}}}.
+        self._last_char_buffers = {}
+
+        # Cached output for the background and the status bar: (key, data).
+        self._background_cache = None
+        self._status_bar_cache = None
+
+        # Frames that were skipped because the client was behind.
+        self.skipped_frames = 0
+
+        # Accumulated changes of the skipped frames.
+        self._pending_parts = Redraw.Nothing
+        self._pending_changes = {}
+        self._paused = False
+
     def get_size(self):
         raise NotImplementedError
 
+    @property
+    def buffered_bytes(self):
+        """ Number of bytes that were written, but not yet sent to the client. """
+        return 0
+
     @asyncio.coroutine
     def _write_output(self, data):
+        """ Write the frame. (A bytearray, UTF-8 encoded.) """
         raise NotImplementedError
 
     @asyncio.coroutine
-    def repaint(self, invalidated_parts, char_buffers):
-        """ Do repaint now. """
+    def repaint(self, invalidated_parts, changes):
+        """
+        Do repaint now, or skip this frame when the client is behind. The
+        changes of skipped frames are sent together with the first frame after
+        the client caught up.
+
+        :param changes: Dictionary that maps panes to the `ScreenChanges`
+                        since the previous frame.
+        """
+        if self._paused:
+            self._add_pending(invalidated_parts, changes)
+            self.skipped_frames += 1
+            return
+
+        if self._pending_parts or self._pending_changes:
+            self._add_pending(invalidated_parts, changes)
+            invalidated_parts = self._pending_parts
+            changes = self._pending_changes
+            self._pending_parts = Redraw.Nothing
+            self._pending_changes = {}
+
+        yield from self._write_frame(invalidated_parts, changes)
+
+    def pause_writing(self):
+        """ The write buffer went over the high watermark. """
+        self._paused = True
+
+    def resume_writing(self):
+        """
+        The write buffer drained. Ask for a new frame. (It includes the changes
+        of the skipped frames.)
+        """
+        self._paused = False
+
+        session = self.session() if self.session else None
+        if session and (self._pending_parts or self._pending_changes):
+            session.invalidate(Redraw.Nothing)
+
+    def _add_pending(self, invalidated_parts, changes):
+        """ Merge the changes of a skipped frame. """
+        self._pending_parts |= invalidated_parts
+
+        for pane, (scrolls, lines) in changes.items():
+            pending = self._pending_changes.get(pane)
+
+            if pending is None:
+                self._pending_changes[pane] = ScreenChanges(list(scrolls), set(lines))
+            else:
+                # The lines that were dirty before move along with the scrolls.
+                pending_lines = pending.lines
+                for top, bottom, count in scrolls:
+                    pending_lines = shift_lines(pending_lines, top, bottom, count)
+
+                self._pending_changes[pane] = ScreenChanges(
+                        pending.scrolls + scrolls, pending_lines | lines)
+
+    def _can_scroll(self, pane, scrolls):
+        """
+        True when the scroll operations of this pane can be done by scrolling
+        the terminal. The pane has to span the whole width of this client,
+        because the terminal can only scroll complete lines. (When the client
+        is wider than the session, the background right of the pane would
+        scroll along.)
+        """
+        return pane.px == 0 and pane.sx >= self.get_size().x and all(
+                0 <= top and bottom < pane.sy and abs(count) <= bottom - top
+                for top, bottom, count in scrolls)
+
+    def _scroll_previous(self, pane, previous, top, bottom, count):
+        """ Apply a scroll operation to what this client received. """
+        blank = Cell(' ', 0)
+
+        if count > 0:
+            lines = range(top, bottom + 1)
+        else:
+            lines = range(bottom, top - 1, -1)
+
+        for y in lines:
+            source = y + count
+            if top <= source <= bottom:
+                previous[y] = previous[source]
+            else:
+                previous[y] = { x: blank for x in range(pane.sx) }
+
+    def _get_char_buffers(self, invalidated_parts, changes):
+        """
+        Compare the changed lines against what this client received, and
+        return the cells that have to be redrawn, and the scroll operations
+        that have to be done by the terminal. Panes that were never sent to
+        this client are returned completely.
+        """
+        session = self.session()
+        char_buffers = {}
+        scrolls = {}
+
+        if invalidated_parts & Redraw.ClearFirst:
+            self._last_char_buffers = {}
+        else:
+            # Forget panes that were removed from the window, or that are in
+            # another window. (Don't keep their screens alive.)
+            panes = session.active_window.panes if session.active_window else []
+            for pane in [p for p in self._last_char_buffers if p not in panes]:
+                del self._last_char_buffers[pane]
+
+        if session.active_window:
+            for pane in session.active_window.panes:
+                previous = self._last_char_buffers.get(pane)
+
+                if previous is None:
+                    previous = self._last_char_buffers[pane] = defaultdict(dict)
+                    diff = pane.screen.dump_character_diff(None)
+
+                elif pane in changes:
+                    pane_scrolls, lines = changes[pane]
+
+                    if pane_scrolls and self._can_scroll(pane, pane_scrolls):
+                        for top, bottom, count in pane_scrolls:
+                            self._scroll_previous(pane, previous, top, bottom, count)
+                        scrolls[pane] = pane_scrolls
+                    else:
+                        # Compare every line that scrolled instead.
+                        lines = set(lines)
+                        for top, bottom, count in pane_scrolls:
+                            lines.update(range(top, bottom + 1))
+
+                    diff = pane.screen.dump_character_diff(previous, lines)
+                else:
+                    continue
+
+                for line_index, line_data in diff.items():
+                    previous[line_index].update(line_data)
+
+                char_buffers[pane] = diff
+
+        return char_buffers, scrolls
+
+    @asyncio.coroutine
+    def _write_frame(self, invalidated_parts, changes):
         start = datetime.datetime.now()
 
-        # Build and write output
-        data = ''.join(self._repaint(invalidated_parts, char_buffers))
-        yield from self._write_output(data) # TODO: make _write_output asynchronous.
+        # A client that didn't receive anything yet, or that was resized,
+        # needs a full frame.
+        if self._last_size != self.get_size():
+            invalidated_parts |= Redraw.All
+
+        char_buffers, scrolls = self._get_char_buffers(invalidated_parts, changes)
+
+        # Build and write output. (The whole frame in a single write.)
+        data = self._repaint(invalidated_parts, char_buffers, scrolls)
+        yield from self._write_output(data)
 
         #logger.info('Bytes: %r' % data)
         logger.info('Redraw generation done in %ss, bytes=%i' %
                 (datetime.datetime.now() - start, len(data)))
 
-    def _repaint(self, invalidated_parts, char_buffers):
-        data = []
-        write = data.append
+    def _repaint(self, invalidated_parts, char_buffers, scrolls=None):
+        data = bytearray()
+        write = data.extend
         session = self.session()
 
+        # Begin synchronized update.
+        if self.use_synchronized_update:
+            write(b'\033[?2026h')
+
         if invalidated_parts & Redraw.ClearFirst:
-            write('\u001b[2J') # Erase screen
+            write(b'\033[2J') # Erase screen
 
         # Hide cursor
-        write('\033[?25l')
+        write(b'\033[?25l')
 
-        # Draw panes.
-        if invalidated_parts & Redraw.Panes and session.active_window:
-            logger.info('Redraw panes')
-            for pane in session.active_window.panes:
-                data += self._repaint_pane(pane, char_buffer=char_buffers[pane])
+        # Draw panes. (Only the panes that have changes.)
+        if session.active_window:
+            for pane, char_buffer in char_buffers.items():
+                if scrolls and pane in scrolls:
+                    data += self._repaint_scrolls(pane, scrolls[pane])
+
+                if char_buffer:
+                    logger.info('Redraw pane %r' % pane.id)
+                    data += self._repaint_pane(pane, char_buffer=char_buffer)
 
         # Draw borders
         if invalidated_parts & Redraw.Borders and session.active_window:
@@ -100,201 +505,237 @@ class Renderer:
 
         if active_pane and not active_pane.screen.cursor.hidden:
             ypos, xpos = active_pane.cursor_position
-            write('\033[%i;%iH' % (active_pane.py + ypos+1, active_pane.px + xpos+1))
+            write(('\033[%i;%iH' % (active_pane.py + ypos+1, active_pane.px + xpos+1)).encode('ascii'))
 
             # Make cursor visible
-            write('\033[?25h')
+            write(b'\033[?25h')
 
             # Set arrows in application/cursor sequences.
             # (Applications like Vim expect an other kind of cursor sequences.
             # This mode is the way of telling the VT terminal which sequences
             # it should send.)
             if (1 << 5) in active_pane.screen.mode:
-                write('\033[?1h') # Set application sequences
+                write(b'\033[?1h') # Set application sequences
             else:
-                write('\033[?1l') # Reset
+                write(b'\033[?1l') # Reset
+
+        # End synchronized update.
+        if self.use_synchronized_update:
+            write(b'\033[?2026l')
 
         invalidated_parts = Redraw.Nothing
 
         return data
 
     def _repaint_border(self, session):
-        data = []
-        write = data.append
+        data = bytearray()
+        write = data.extend
+
+        active_pane = session.active_pane
+        last_active = None
+
+        border_map = session.active_window.get_border_map(session.sx, session.sy - 1)
 
-        for y in range(0, session.sy - 1):
-            write('\033[%i;%iH' % (y+1, 0))
+        for x, y, cells in border_map:
+            write(('\033[%i;%iH' % (y+1, x+1)).encode('ascii'))
 
-            for x in range(0, session.sx):
-                border_type, is_active = self._check_cell(session, x, y)
+            for border_type, panes in cells:
+                is_active = active_pane in panes
 
-                if border_type and border_type != BorderType.Inside:
-                    write('\033[%i;%iH' % (y+1, x+1)) # XXX: we don't have to send this every time. Optimize.
-                    write('\033[0m') # Reset colour
+                if is_active != last_active:
+                    write(b'\033[0m') # Reset colour
 
                     if is_active:
-                        write('\033[0;%im' % 32)
+                        write(b'\033[0;32m') # Green
 
-                    write(BorderSymbols[border_type])
+                    last_active = is_active
+
+                write(_glyph(BorderSymbols[border_type]))
 
         return data
 
     def _repaint_background(self, session):
-        data = []
+        """
+        Fill the area outside the session (when this client is larger than
+        the smallest client) with dots. The output is cached until the size
+        changes.
+        """
         size = self.get_size()
+        key = (size, session.sx, session.sy)
 
-        # Only redraw background when the size has been changed.
-        write = data.append
+        if self._background_cache is None or self._background_cache[0] != key:
+            width, height = size
+            sx = session.sx
+            sy = session.sy
 
-        write('\033[37m') # white fg
-        write('\033[43m') # yellow bg
-        width, height = size
+            encoder = OutputEncoder(width, use_rep=self.use_rep, use_erase=self.use_erase)
+            encoder.data.extend(b'\033[0m')
+            dot = Cell('.', _background_style)
 
-        sx = session.sx
-        sy = session.sy
+            for y in range(0, height - 1):
+                if y >= sy:
+                    encoder.write_cells(y, 0, dot, width)
+                elif width > sx:
+                    encoder.write_cells(y, sx, dot, width - sx)
 
-        for y in range(0, height - 1):
-            for x in range(0, width):
-                if x >= sx or y >= sy:
-                    write('\033[%i;%iH.' % (y+1, x+1))
+            self._background_cache = (key, encoder.data)
 
         self._last_size = size
-        return data
+        return self._background_cache[1]
 
     def _repaint_status_bar(self, session):
-        data = []
-        write = data.append
-
+        """
+        Draw the status bar. The output is cached until the text or the size
+        changes.
+        """
         width, height = self.get_size()
+        text = session.status_bar.left_text
+        rtext = session.status_bar.right_text
+        key = (text, rtext, width, height)
 
-        # Go to bottom line
-        write('\033[%i;0H' % height)
+        if self._status_bar_cache is None or self._status_bar_cache[0] != key:
+            data = bytearray()
+            write = data.extend
 
-        # Set background
-        write('\033[%im' % 43) # Brown
+            # Go to bottom line
+            write(('\033[%iH' % height).encode('ascii'))
 
-        # Set foreground
-        write('\033[%im' % 30) # Black
+            # Brown background, black foreground, bold.
+            write(b'\033[0;43;30;1m')
 
-        # Set bold
-        write('\033[1m')
+            space_left = width - len(text) - len(rtext)
 
-        text = session.status_bar.left_text
-        rtext = session.status_bar.right_text
-        space_left = width - len(text) - len(rtext)
-        logger.info('WIDTH=%r ' %  width)
+            text += ' ' * space_left + rtext
+            text = text[:width]
+            write(text.encode('utf-8'))
 
-        text += ' ' * space_left + rtext
-        text = text[:width]
-        write(text)
+            self._status_bar_cache = (key, data)
 
-        return data
+        return self._status_bar_cache[1]
 
-    def _repaint_pane(self, pane, char_buffer=None):
-        data = []
-        write = data.append
+    def _repaint_scrolls(self, pane, scrolls):
+        """
+        Scroll the lines of this pane, using a scroll region. (The exposed
+        lines are filled with blanks in the default style.)
+        """
+        data = bytearray()
+        write = data.extend
 
-        last_fg = 'default'
-        last_bg = 'default'
-        last_bold = False
-        last_underscore = False
-        last_reverse = False
-        last_pos = (-10, -10)
+        write(b'\033[0m')
 
-        write('\033[0m')
+        for top, bottom, count in scrolls:
+            write(('\033[%i;%ir' % (pane.py + top + 1, pane.py + bottom + 1)).encode('ascii'))
 
-        for line_index, line_data in char_buffer.items():
-            for column_index, char in line_data.items():
-                # Only send position when it it's not next to the last one.
-                if (line_index, column_index + pane.px) == (last_pos[0] + 1, 0):
-                    write('\r\n') # Optimization for the next line
-                elif (line_index, column_index) != (last_pos[0], last_pos[1] + 1):
-                    write('\033[%i;%iH' % (pane.py + line_index + 1, pane.px + column_index + 1))
-                                # TODO: also optimize if the last skipped character is a space.
-                last_pos = (line_index, column_index)
-
-                # If the bold/underscore/reverse parameters are reset.
-                # Always use global reset.
-                if (last_bold and not char.bold) or \
-                                    (last_underscore and not char.underscore) or \
-                                    (last_reverse and not char.reverse):
-                    write('\033[0m')
-
-                    last_fg = 'default'
-                    last_bg = 'default'
-                    last_bold = False
-                    last_underscore = False
-                    last_reverse = False
-
-                if char.fg != last_fg:
-                    colour_code = reverse_colour_code.get(char.fg, None)
-                    if colour_code:
-                        write('\033[0;%im' % colour_code)
-                    else: # 256 colour
-                        write('\033[38;5;%im' % (char.fg - 1024))
-                    last_fg = char.fg
-
-                if char.bg != last_bg:
-                    colour_code = reverse_bgcolour_code.get(char.bg, None)
-                    if colour_code:
-                        write('\033[%im' % colour_code)
-                    else: # 256 colour
-                        write('\033[48;5;%im' % (char.bg - 1024))
-                    last_bg = char.bg
-
-                if char.bold and not last_bold:
-                    write('\033[1m')
-                    last_bold = char.bold
-
-                if char.underscore and not last_underscore:
-                    write('\033[4m')
-                    last_underscore = char.underscore
-
-                if char.reverse and not last_reverse:
-                    write('\033[7m')
-                    last_reverse = char.reverse
-
-                write(char.data)
+            if count > 0:
+                write(_csi(count, 'S').encode('ascii')) # Scroll up.
+            else:
+                write(_csi(-count, 'T').encode('ascii')) # Scroll down.
 
+        # Reset scroll region. (This also moves the cursor home.)
+        write(b'\033[r')
         return data
 
-    def _check_cell(self, session, x, y):
-        """ For a given (x,y) cell, return the pane to which this belongs, and
-        the type of border we have there.
-
-        :returns: BorderType
-        """
-        # Create mask: set bits when the touching cells are borders.
-        mask = 0
-        is_active = False
-
-        for pane in session.active_window.panes:
-            border_type = pane._get_border_type(x, y)
+    def _repaint_pane(self, pane, char_buffer=None):
+        encoder = OutputEncoder(self.get_size().x, use_rep=self.use_rep,
+                                use_erase=self.use_erase)
+        encoder.data.extend(b'\033[0m')
 
-            # If inside pane:
-            if border_type == BorderType.Inside:
-                return border_type, False
+        for line_index, line_data in char_buffer.items():
+            row = pane.py + line_index
+            cells = list(line_data.items())
+            i = 0
+
+            # Group identical cells in adjacent columns.
+            while i < len(cells):
+                column_index, char = cells[i]
+                j = i + 1
+                while (j < len(cells) and cells[j][1] == char and
+                        cells[j][0] == column_index + j - i):
+                    j += 1
+
+                encoder.write_cells(row, pane.px + column_index, char, j - i)
+                i = j
+
+        return encoder.data
+
+
+class OutputProtocol(BaseProtocol):
+    """
+    Protocol for the output pipe of a client. The transport calls
+    `pause_writing` and `resume_writing` when its write buffer crosses the
+    watermarks. These calls are passed to the renderer.
+    """
+    def __init__(self):
+        self.renderer = None
 
-            mask |= border_type
-            is_active = is_active or (border_type and pane == session.active_pane)
+    def pause_writing(self):
+        if self.renderer:
+            self.renderer.pause_writing()
 
-        return mask, is_active
+    def resume_writing(self):
+        if self.renderer:
+            self.renderer.resume_writing()
 
 
 class PipeRenderer(Renderer):
-    def __init__(self, write_func):
+    """
+    Renderer that writes to a pipe.
+
+    :param write_func: Callable that writes bytes to the client.
+    :param transport: The transport behind `write_func`. (Optional.) When
+                      given, its write buffer limits are set to the watermarks
+                      of this renderer.
+    :param protocol: The `OutputProtocol` of this transport. (Optional.) When
+                     given, frames are skipped while the transport is paused.
+    """
+    def __init__(self, write_func, transport=None, protocol=None):
         super().__init__()
         self._write_func = write_func
+        self._transport = transport
+        self.use_rep = has_terminal_capability('rep')
+
+        if transport:
+            transport.set_write_buffer_limits(high=self.high_watermark, low=self.low_watermark)
+
+        if protocol:
+            protocol.renderer = self
+
+    @property
+    def buffered_bytes(self):
+        if self._transport:
+            return self._transport.get_write_buffer_size()
+        else:
+            return 0
 
     @asyncio.coroutine
     def _write_output(self, data):
-        self._write_func(data.encode('utf-8'))
+        self._write_func(data)
 
     def get_size(self):
         y, x = get_size(sys.stdout)
         return RendererSize(x, y)
 
 
+class NullRenderer(Renderer):
+    """
+    Renderer that doesn't write anywhere. It has a fixed size and counts the
+    frames and bytes that it would have written. (For benchmarks.)
+    """
+    def __init__(self, width=80, height=24):
+        super().__init__()
+        self.size = RendererSize(width, height)
+        self.frames = 0
+        self.bytes_written = 0
+
+    @asyncio.coroutine
+    def _write_output(self, data):
+        self.frames += 1
+        self.bytes_written += len(data)
+
+    def get_size(self):
+        return self.size
+
+
 ## class StdoutRenderer(Renderer):
 ##     """
 ##     Renderer which is connected to sys.stdout.
@@ -7,8 +7,19 @@ Changes compared to the original `Screen` class:
       hidden text will appear again.
     - 256 colour support (xterm)
     - Per character diffs instead of per line diffs.
+    - Dirty line tracking: only the lines that were touched since the last
+      call of `pop_changes` have to be compared by `dump_character_diff`.
+    - Scroll tracking: scrolling is recorded as an operation instead of
+      marking all the lines dirty, so that renderers can scroll the terminal.
+    - Compact line storage: every line is an array of characters with a
+      parallel array of style ids, instead of a dict of `Char` instances.
+    - Style interning: character attributes are registered once in `styles`
+      and referred to by a small integer id.
+    - Bounded scrollback: lines are kept in a ring buffer, the oldest lines
+      are dropped when more than `history_limit` lines scrolled out of view.
 """
-from collections import defaultdict
+from array import array
+from collections import defaultdict, namedtuple
 from pyte import charsets as cs
 from pyte import modes as mo
 from pyte.graphics import FG, BG
@@ -47,6 +58,221 @@ BG.update({
 })
 
 
+# A cell, as returned by `BetterScreen.dump_character_diff`. `style` is an
+# id in the `styles` registry.
+Cell = namedtuple('Cell', 'data style')
+
+# Changes of a screen, as returned by `BetterScreen.pop_changes`. `scrolls` is
+# a list of (top, bottom, count) operations: lines `top` until `bottom`
+# (inclusive) moved `count` lines up, or down when `count` is negative.
+# `lines` is the set of lines that were modified after these scrolls.
+ScreenChanges = namedtuple('ScreenChanges', 'scrolls lines')
+
+
+def shift_lines(lines, top, bottom, count):
+    """
+    Return the set of line numbers after scrolling the region `top`-`bottom`
+    `count` lines up (or down when negative.) Lines that leave the region are
+    dropped, the lines that become exposed are added.
+    """
+    result = set()
+
+    for y in lines:
+        if top <= y <= bottom:
+            y -= count
+            if top <= y <= bottom:
+                result.add(y)
+        else:
+            result.add(y)
+
+    if count > 0:
+        result.update(range(max(top, bottom - count + 1), bottom + 1))
+    else:
+        result.update(range(top, min(bottom, top - count - 1) + 1))
+
+    return result
+
+
+class StyleRegistry:
+    """
+    Registry of character attributes.
+
+    Every distinct combination of (fg, bg, bold, italics, underscore,
+    strikethrough, reverse) is stored once, as a `Char` with a space as data,
+    and gets a small integer id. Id 0 is the default style.
+    """
+    def __init__(self):
+        self._styles = []
+        self._ids = {}
+        self.get_id(Char(data=' '))
+
+    def __len__(self):
+        return len(self._styles)
+
+    def __getitem__(self, style_id):
+        """ Return the attributes (as a `Char`) for this style id. """
+        return self._styles[style_id]
+
+    def get_id(self, attrs):
+        """ Return the style id for these attributes. Register if needed. """
+        if attrs.data != ' ':
+            attrs = attrs._replace(data=' ')
+
+        try:
+            return self._ids[attrs]
+        except KeyError:
+            style_id = self._ids[attrs] = len(self._styles)
+            self._styles.append(attrs)
+            return style_id
+
+    def intern(self, attrs):
+        """ Return the shared `Char` instance for these attributes. """
+        return self._styles[self.get_id(attrs)]
+
+
+styles = StyleRegistry()
+
+
+class Line:
+    """
+    A single line in the screen buffer.
+
+    The characters are stored in a unicode array, the style ids in a parallel
+    integer array. Everything after the end of the arrays is considered blank.
+    """
+    __slots__ = ('text', 'styles')
+
+    default_style = 0
+
+    def __init__(self):
+        self.text = array('u')
+        self.styles = array('I')
+
+    def __len__(self):
+        return len(self.text)
+
+    def _pad(self, length):
+        """ Make sure that the line is at least `length` characters long. """
+        missing = length - len(self.text)
+        if missing > 0:
+            self.text.fromunicode(' ' * missing)
+            self.styles.extend([self.default_style] * missing)
+
+    def get_char(self, x):
+        """ Return the `Cell` at this position. """
+        if x < len(self.text):
+            return Cell(self.text[x], self.styles[x])
+        else:
+            return Cell(' ', self.default_style)
+
+    def set_char(self, x, data, style):
+        self._pad(x + 1)
+        self.text[x] = data
+        self.styles[x] = style
+
+    def write(self, x, text, style):
+        """ Write a string at this position, using a single style. """
+        self._pad(x)
+        end = x + len(text)
+        self.text[x:end] = array('u', text)
+        self.styles[x:end] = array('I', [style]) * len(text)
+
+    def erase(self, start=0, end=None):
+        """ Erase the characters in the range [start, end). """
+        if end is None or end >= len(self.text):
+            del self.text[start:]
+            del self.styles[start:]
+        elif start < end:
+            count = end - start
+            self.text[start:end] = array('u', ' ' * count)
+            self.styles[start:end] = array('I', [self.default_style] * count)
+
+    def insert_blanks(self, x, count, max_length):
+        """ Insert blanks at this position, shifting the rest to the right. """
+        if x < len(self.text):
+            self.text[x:x] = array('u', ' ' * count)
+            self.styles[x:x] = array('I', [self.default_style] * count)
+
+            del self.text[max_length:]
+            del self.styles[max_length:]
+
+    def delete(self, x, count):
+        """ Delete characters at this position, shifting the rest to the left. """
+        del self.text[x:x + count]
+        del self.styles[x:x + count]
+
+    def map_attrs(self, func):
+        """ Apply `func` to the attributes of every character. """
+        self.styles = array('I', [styles.get_id(func(styles[i])) for i in self.styles])
+
+
+class LineBuffer:
+    """
+    Ring buffer that maps line indexes to `Line` instances.
+
+    The buffer has a fixed number of slots; line `i` is stored in slot
+    `i % capacity`, so writing a new line at the bottom automatically evicts
+    the line that is `capacity` lines above it. Lines that were never
+    written (or were evicted) are missing, which means they're empty.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._slots = [None] * capacity # (index, line) tuples.
+
+        # Highest line index that was ever written. (-1 when empty.)
+        self.last_index = -1
+
+    def __bool__(self):
+        return self.last_index >= 0
+
+    def __contains__(self, index):
+        slot = self._slots[index % self.capacity]
+        return slot is not None and slot[0] == index
+
+    def __getitem__(self, index):
+        slot = self._slots[index % self.capacity]
+        if slot is not None and slot[0] == index:
+            return slot[1]
+        raise KeyError(index)
+
+    def __setitem__(self, index, line):
+        self._slots[index % self.capacity] = (index, line)
+        if index > self.last_index:
+            self.last_index = index
+
+    def get(self, index, default=None):
+        slot = self._slots[index % self.capacity]
+        if slot is not None and slot[0] == index:
+            return slot[1]
+        return default
+
+    def pop(self, index, default=None):
+        i = index % self.capacity
+        slot = self._slots[i]
+        if slot is not None and slot[0] == index:
+            self._slots[i] = None
+            return slot[1]
+        return default
+
+    def values(self):
+        return [slot[1] for slot in self._slots if slot is not None]
+
+    def set_capacity(self, capacity):
+        """
+        Change the number of slots. Only the most recent lines are kept when
+        the buffer shrinks.
+        """
+        if capacity != self.capacity:
+            slots = [slot for slot in self._slots if slot is not None and
+                     slot[0] > self.last_index - capacity]
+
+            self.capacity = capacity
+            self._slots = [None] * capacity
+
+            for index, line in slots:
+                self._slots[index % capacity] = (index, line)
+
+
 class BetterScreen(pyte.Screen):
     swap_variables = [
             'mode',
@@ -59,9 +285,10 @@ class BetterScreen(pyte.Screen):
             'line_offset',
             ]
 
-    def __init__(self, lines, columns):
+    def __init__(self, lines, columns, history_limit=2000):
         self.lines = lines
         self.columns = columns
+        self.history_limit = history_limit # Lines to keep above the visible area.
         self.reset()
 
     def __before__(self, command):
@@ -69,12 +296,18 @@ class BetterScreen(pyte.Screen):
         logger.info('              %r' % command)
 
     def reset(self):
-        self.buffer = defaultdict(lambda: defaultdict(lambda: Char(data=' ')))
+        self.buffer = LineBuffer(self.history_limit + self.lines)
         self.mode = set([mo.DECAWM, mo.DECTCEM])
         self.margins = Margins(0, self.lines - 1)
 
         self.line_offset = 0 # Index of the line that's currently displayed on top.
 
+        # Set of (visible) line numbers that were modified since the last
+        # call of `pop_changes`, and the scroll operations that happened
+        # before these modifications.
+        self.dirty = set(range(self.lines))
+        self.scrolls = []
+
         # According to VT220 manual and ``linux/drivers/tty/vt.c``
         # the default G0 charset is latin-1, but for reasons unknown
         # latin-1 breaks ascii-graphics; so G0 defaults to cp437.
@@ -90,28 +323,106 @@ class BetterScreen(pyte.Screen):
         self.cursor = Cursor(0, 0)
         self.cursor_position()
 
-    def dump_character_diff(self, previous_dump):
+        # Style id of the cursor attributes, cached by identity.
+        self._cursor_attrs = None
+        self._cursor_style = 0
+
+    def _get_cursor_style(self):
+        """ Return the style id for the current cursor attributes. """
+        attrs = self.cursor.attrs
+        if attrs is not self._cursor_attrs:
+            self._cursor_style = styles.get_id(attrs)
+            self._cursor_attrs = attrs
+        return self._cursor_style
+
+    def _get_line(self, y):
+        """
+        Return the `Line` that is displayed at this (visible) line number.
+        Create it if it doesn't exist yet.
+        """
+        try:
+            return self.buffer[y + self.line_offset]
+        except KeyError:
+            line = self.buffer[y + self.line_offset] = Line()
+            return line
+
+    def _move_line(self, source, destination):
+        """
+        Move the line at the `source` index (in the buffer) to `destination`.
+        This leaves an empty line at `source`.
+        """
+        line = self.buffer.pop(source, None)
+        if line is None:
+            self.buffer.pop(destination, None)
+        else:
+            self.buffer[destination] = line
+
+    def _mark_dirty(self, lines=None):
+        """
+        Mark visible lines as dirty. (All of them when no lines are given.)
+        """
+        if lines is None:
+            self.dirty.update(range(self.lines))
+            self.scrolls = [] # Everything has to be compared anyway.
+        else:
+            self.dirty.update(lines)
+
+    def _scroll(self, top, bottom, count):
+        """
+        Record that the lines `top`-`bottom` scrolled `count` lines up. (Down
+        when negative.) The lines that are already dirty move along.
+        """
+        self.dirty = shift_lines(self.dirty, top, bottom, count)
+
+        # Merge with the previous operation, when it scrolled the same region
+        # in the same direction.
+        if self.scrolls:
+            last_top, last_bottom, last_count = self.scrolls[-1]
+            if (last_top, last_bottom) == (top, bottom) and (last_count > 0) == (count > 0):
+                self.scrolls[-1] = (top, bottom, last_count + count)
+                return
+
+        self.scrolls.append((top, bottom, count))
+
+    def pop_changes(self):
+        """
+        Return the `ScreenChanges` since the last call, and reset them.
+        """
+        changes = ScreenChanges(self.scrolls, set(y for y in self.dirty if y < self.lines))
+        self.dirty = set()
+        self.scrolls = []
+        return changes
+
+    def dump_character_diff(self, previous_dump, lines=None):
         """
         Create a copy of the visible buffer.
+
+        When a previous dump is given, only the given lines are compared
+        against it; the caller knows that all the other lines are unchanged.
+        (Usually, these are the lines returned by `pop_changes`.) Without
+        previous dump, everything is returned.
         """
-        space = Char(data=' ')
-        result = defaultdict(lambda: defaultdict(lambda: Char(data=' ')))
+        space = Cell(' ', Line.default_style)
+        result = defaultdict(lambda: defaultdict(lambda: space))
         offset = self.line_offset
 
         def chars_eq(c1, c2):
             return c1 == c2 #or (c1.data == ' ' and c2.data == ' ') # TODO: unless they have a background or underline, etc...
 
-        for y in range(0, self.lines):
-            if (y + offset) in self.buffer:
-                line = self.buffer[y + offset]
-            else:
-                # Empty line
-                line = defaultdict(lambda: Char(data=' '))
+        if previous_dump is not None and lines is not None:
+            lines = sorted(y for y in lines if y < self.lines)
+        else:
+            previous_dump = None
+            lines = range(0, self.lines)
+
+        for y in lines:
+            line = self.buffer.get(y + offset)
+            length = len(line) if line else 0
+            previous_line = previous_dump.get(y, {}) if previous_dump is not None else {}
 
             for x in range(0, self.columns):
-                char = line.get(x, space)
-                #if not previous_dump or previous_dump[y][x] != char:
-                if not (previous_dump and chars_eq(previous_dump[y][x], char)):
+                char = line.get_char(x) if x < length else space
+                if not chars_eq(previous_line.get(x), char):
                     result[y][x] = char
 
         return result
@@ -121,6 +432,7 @@ class BetterScreen(pyte.Screen):
         self.lines = lines if lines is not None else self.lines
         self.columns = columns if columns is not None else self.columns
         self._reset_offset_and_margins()
+        self._mark_dirty()
 
     def _reset_offset_and_margins(self):
         """
@@ -128,10 +440,14 @@ class BetterScreen(pyte.Screen):
         visible.)
         """
         self.margins = Margins(0, self.lines - 1)
+        self.buffer.set_capacity(self.history_limit + self.lines)
 
         if self.buffer:
-            new_line_offset = max(0, max(self.buffer.keys()) - self.lines + 4)
+            new_line_offset = max(0, self.buffer.last_index - self.lines + 4)
             self.cursor.y += (self.line_offset - new_line_offset)
+
+            if new_line_offset != self.line_offset:
+                self._mark_dirty()
             self.line_offset = new_line_offset # TODO: maybe put this in a scroll_offset function.
 
     def set_mode(self, *modes, **kwargs):
@@ -157,8 +473,8 @@ class BetterScreen(pyte.Screen):
         # Mark all displayed characters as reverse. # TODO !!
         if mo.DECSCNM in modes:
             for line in self.buffer.values():
-                for pos, char in line.items():
-                    line[pos] = char._replace(reverse=True)
+                line.map_attrs(lambda a: a._replace(reverse=True))
+            self._mark_dirty()
 
             self.select_graphic_rendition(g._SGR["+reverse"])
 
@@ -193,8 +509,8 @@ class BetterScreen(pyte.Screen):
 
         if mo.DECSCNM in modes: # TODO verify!!
             for line in self.buffer.values():
-                for pos, char in line.items():
-                    line[pos] = char._replace(reverse=False)
+                line.map_attrs(lambda a: a._replace(reverse=False))
+            self._mark_dirty()
             self.select_graphic_rendition(g._SGR["-reverse"])
 
         # Hide the cursor.
@@ -210,6 +526,7 @@ class BetterScreen(pyte.Screen):
             self._original_screen = None
             self._original_screen_vars = {}
             self._reset_offset_and_margins()
+            self._mark_dirty()
 
     def draw(self, char):
         # Translating a given character.
@@ -233,15 +550,46 @@ class BetterScreen(pyte.Screen):
         if mo.IRM in self.mode:
             self.insert_characters(1)
 
-        self._set_char(self.cursor.x, self.cursor.y,
-                                self.cursor.attrs._replace(data=char))
+        self._set_char(self.cursor.x, self.cursor.y, char, self._get_cursor_style())
 
         # .. note:: We can't use :meth:`cursor_forward()`, because that
         #           way, we'll never know when to linefeed.
         self.cursor.x += 1
 
-    def _set_char(self, x, y, char):
-        self.buffer[y + self.line_offset][x] = char
+    def draw_string(self, text):
+        """
+        Draw a run of printable characters. This is equivalent to calling
+        `draw` for every character, but the text is written into the line
+        one slice at a time.
+        """
+        text = text.translate([self.g0_charset,
+                               self.g1_charset][self.charset])
+        style = self._get_cursor_style()
+
+        while text:
+            # Wrap or stay in the last column. (See `draw`.)
+            if self.cursor.x >= self.columns:
+                if mo.DECAWM in self.mode:
+                    self.carriage_return()
+                    self.linefeed()
+                else:
+                    # Only the last character remains visible.
+                    self.cursor.x = self.columns - 1
+                    text = text[-1:]
+
+            chunk = text[:self.columns - self.cursor.x]
+            text = text[len(chunk):]
+
+            if mo.IRM in self.mode:
+                self.insert_characters(len(chunk))
+
+            self._get_line(self.cursor.y).write(self.cursor.x, chunk, style)
+            self.dirty.add(self.cursor.y)
+            self.cursor.x += len(chunk)
+
+    def _set_char(self, x, y, data, style):
+        self._get_line(y).set_char(x, data, style)
+        self.dirty.add(y)
 
     def index(self):
         """Move the cursor down one line in the same column. If the
@@ -253,13 +601,14 @@ class BetterScreen(pyte.Screen):
         if top == 0 and bottom == self.lines - 1:
             if self.cursor.y == self.lines - 1:
                 self.line_offset += 1
+                self._scroll(top, bottom, 1)
             else:
                 self.cursor_down()
         else:
             if self.cursor.y == bottom:
                 for line in range(top, bottom):
-                    self.buffer[line] = self.buffer[line+1]
-                    del self.buffer[line+1]
+                    self._move_line(line + self.line_offset + 1, line + self.line_offset)
+                self._scroll(top, bottom, 1)
             else:
                 self.cursor_down()
 
@@ -269,8 +618,8 @@ class BetterScreen(pyte.Screen):
         # When scrolling over the full screen -> keep history.
         if self.cursor.y == top:
             for line in range(bottom, top, -1):
-                self.buffer[line] = self.buffer[line-1]
-                del self.buffer[line-1]
+                self._move_line(line + self.line_offset - 1, line + self.line_offset)
+            self._scroll(top, bottom, -1)
         else:
             self.cursor_up()
 
@@ -290,9 +639,9 @@ class BetterScreen(pyte.Screen):
             #    del self.buffer[bottom + self.line_offset]
 
             for line in range(bottom, self.cursor.y + count - 1, -1):
-                self.buffer[line + self.line_offset] = self.buffer[line + self.line_offset - count]
-                del self.buffer[line + self.line_offset - count]
+                self._move_line(line + self.line_offset - count, line + self.line_offset)
 
+            self._mark_dirty(range(self.cursor.y, bottom + 1))
             self.carriage_return()
 
     def delete_lines(self, count=None):
@@ -309,8 +658,11 @@ class BetterScreen(pyte.Screen):
         # If cursor is outside scrolling margins it -- do nothin'.
         if top <= self.cursor.y <= bottom:
             for line in range(self.cursor.y, bottom - count, -1):
-                self.buffer[line + self.line_offset] = self.buffer[line + self.line_offset + count]
-                del self.buffer[line + self.line_offset + count]
+                self._move_line(line + self.line_offset + count, line + self.line_offset)
+
+            # (The loop above writes lines starting at `bottom - count + 1`,
+            # which can be above the cursor.)
+            self._mark_dirty(range(min(self.cursor.y, bottom - count + 1), bottom + 1))
 
     def insert_characters(self, count=None): # XXX: used by pressing space in bash vi mode
         """Inserts the indicated # of blank characters at the cursor
@@ -322,22 +674,20 @@ class BetterScreen(pyte.Screen):
         """
         count = count or 1
 
-        line = self.buffer[self.cursor.y + self.line_offset]
-        max_columns = max(line.keys())
+        line = self.buffer.get(self.cursor.y + self.line_offset)
+        if line:
+            line.insert_blanks(self.cursor.x, count, self.columns)
 
-        for i in range(max_columns, self.cursor.x, -1):
-            line[i + count] = line[i]
-            del line[i]
+        self.dirty.add(self.cursor.y)
 
     def delete_characters(self, count=None): # XXX: used by pressing 'x' on bash vi mode
         count = count or 1
 
-        line = self.buffer[self.cursor.y + self.line_offset]
-        max_columns = max(line.keys())
+        line = self.buffer.get(self.cursor.y + self.line_offset)
+        if line:
+            line.delete(self.cursor.x, count)
 
-        for i in range(self.cursor.x, max_columns):
-            line[i] = line[i + count]
-            del line[i + count]
+        self.dirty.add(self.cursor.y)
 
     def erase_characters(self, count=None):
         raise NotImplementedError('erase_characters not implemented') # TODO
@@ -355,18 +705,16 @@ class BetterScreen(pyte.Screen):
         :param bool private: when ``True`` character attributes aren left
                              unchanged **not implemented**.
         """
-        def should_we_delete(column): # TODO: check for off-by-one errors!
-           if type_of == 0:
-                return column >= self.cursor.x
-           if type_of == 1:
-                return column <= self.cursor.x
-           if type_of == 2:
-                return True
-
-        line = self.buffer[self.cursor.y + self.line_offset]
-        for column in list(line.keys()):
-           if should_we_delete(column):
-               del line[column]
+        line = self.buffer.get(self.cursor.y + self.line_offset)
+        if line:
+            if type_of == 0:
+                line.erase(self.cursor.x)
+            elif type_of == 1:
+                line.erase(0, self.cursor.x + 1)
+            elif type_of == 2:
+                line.erase()
+
+        self.dirty.add(self.cursor.y)
 
     def erase_in_display(self, type_of=0, private=False):
         """Erases display in a specific way.
@@ -394,7 +742,8 @@ class BetterScreen(pyte.Screen):
         )[type_of]
 
         for line in interval: # TODO: from where the -1 in the index below??
-            self.buffer[line + self.line_offset] = defaultdict(lambda: Char(data=' '))
+            self.buffer.pop(line + self.line_offset, None)
+        self._mark_dirty(interval)
 
         # In case of 0 or 1 we have to erase the line with the cursor.
         if type_of in [0, 1]:
@@ -402,9 +751,11 @@ class BetterScreen(pyte.Screen):
 
     def alignment_display(self):
         for y in range(0, self.lines):
-            line = self.buffer[y + self.line_offset]
+            line = self._get_line(y)
+            line.erase()
             for x in range(0, self.columns):
-                line[x] = Char('E')
+                line.set_char(x, 'E', Line.default_style)
+        self._mark_dirty()
 
     def select_graphic_rendition(self, *attrs):
         """ Support 256 colours """
@@ -441,7 +792,7 @@ class BetterScreen(pyte.Screen):
                     m = attrs.pop()
                     replace["bg"] = 1024 + m
 
-        self.cursor.attrs = self.cursor.attrs._replace(**replace)
+        self.cursor.attrs = styles.intern(self.cursor.attrs._replace(**replace))
 
         # See tmux/input.c, line: 1388
 
@@ -4,78 +4,160 @@ from .log import logger
 from .statusbar import StatusBar
 from .window import Window
 
-from collections import defaultdict
-from pyte.screens import Char
-
 import asyncio
+import time
 import weakref
 
 loop = asyncio.get_event_loop()
 
 
-MAX_WORKERS = 1024 # Max number of threads for the pane runners.
-
-
 class Session:
     """
     A session is a container of windows (which at their turn contain panes) and
     is responsible for window management.
     """
+    # Minimal time between the start of two frames. (Caps at 60 fps.)
+    min_frame_interval = 1. / 60
+
+    # After a key press, repaints are not delayed during this time, so that
+    # the echo of typed characters appears immediately.
+    input_echo_timeout = .2
+
     def __init__(self):
         self.renderers = []
         self.windows = [ ]
         self.active_window = None
 
-        self._last_char_buffers = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: Char)))
+        # Size of the layout. (Set by update_size.)
+        self.sx = None
+        self.sy = None
 
         self._invalidated = False
         self._invalidate_parts = 0
+        self._invalidated_panes = set() # Panes to redraw, apart from Redraw.Panes.
+
+        self._repaint_handle = None
+        self._repaint_time = None # Time for which the repaint is scheduled.
+        self._last_frame_time = 0
+        self._last_input_time = 0
+
+        # Frame statistics.
+        self.frame_count = 0
+        self.frames_per_second = 0
+        self._fps_frame_count = 0
+        self._fps_start = loop.time()
 
         self.status_bar = StatusBar(weakref.ref(self))
+        self._clock_handle = None # Runs while there are renderers.
 
         self.invalidate()
 
-    def invalidate(self, invalidate_parts=Redraw.All):
-        """ Schedule repaint. """
+    def invalidate(self, invalidate_parts=Redraw.All, immediate=False):
+        """
+        Schedule repaint.
+
+        Repaints are coalesced and rate limited to one every
+        `min_frame_interval` seconds, unless `immediate` is given or the user
+        typed something very recently.
+        """
         self._invalidate_parts |= invalidate_parts
 
-        if not self._invalidated:
-            logger.info('Scheduling repaint: %r' % self._invalidate_parts)
-            self._invalidated = True
-            loop.call_soon(lambda: asyncio.async(self.repaint()))
+        # When a repaint is running, it will reschedule itself.
+        if self._invalidated and not self._repaint_handle:
+            return
+
+        now = loop.time()
+
+        if immediate or now - self._last_input_time < self.input_echo_timeout:
+            when = now
+        else:
+            when = max(now, self._last_frame_time + self.min_frame_interval)
+
+        # Already scheduled, and soon enough.
+        if self._repaint_handle:
+            if self._repaint_time <= when:
+                return
+            self._repaint_handle.cancel()
+
+        logger.info('Scheduling repaint: %r' % self._invalidate_parts)
+        self._invalidated = True
+        self._repaint_time = when
+
+        if when <= now:
+            self._repaint_handle = loop.call_soon(self._start_repaint)
+        else:
+            self._repaint_handle = loop.call_at(when, self._start_repaint)
+
+    def invalidate_status_bar(self):
+        """ The window list or an active pane changed. """
+        self.status_bar.invalidate()
+        self.invalidate(Redraw.StatusBar)
+
+    def _schedule_clock_tick(self):
+        # Align the ticks with the clock.
+        interval = self.status_bar.clock_interval
+        self._clock_handle = loop.call_later(interval - time.time() % interval, self._clock_tick)
+
+    def _clock_tick(self):
+        """ Redraw the status bar clock. """
+        self._clock_handle = None
+        self.status_bar.tick()
+        self.invalidate(Redraw.StatusBar)
+        self._schedule_clock_tick()
+
+    def _stop_clock(self):
+        if self._clock_handle:
+            self._clock_handle.cancel()
+            self._clock_handle = None
+
+    def invalidate_pane(self, pane):
+        """ Schedule repaint of a single pane. """
+        self._invalidated_panes.add(pane)
+        self.invalidate(Redraw.Nothing)
+
+    def _start_repaint(self):
+        self._repaint_handle = None
+        asyncio.async(self.repaint())
+
+    def _count_frame(self):
+        """ Update the frame statistics. """
+        now = loop.time()
+        self._last_frame_time = now
+        self.frame_count += 1
+        self._fps_frame_count += 1
+
+        if now - self._fps_start >= 1:
+            self.frames_per_second = self._fps_frame_count / (now - self._fps_start)
+            self._fps_frame_count = 0
+            self._fps_start = now
 
     def repaint(self):
+        self._count_frame()
         parts = self._invalidate_parts
 
         if not self.active_window:
-            char_diffs = { }
+            changes = { }
         else:
-            # Dump diffs for visible panes
-            def get_previous_dump(pane):
-                if self._invalidate_parts & Redraw.ClearFirst:
-                    return None
-                else:
-                    return self._last_char_buffers[pane]
+            # Only look at the panes that were invalidated, unless all of them
+            # have to be redrawn. Every renderer compares the changed lines
+            # against what its own client received.
+            if parts & Redraw.Panes:
+                panes = self.active_window.panes
+            else:
+                panes = [p for p in self.active_window.panes if p in self._invalidated_panes]
 
-            char_diffs = {
-                pane:pane.screen.dump_character_diff(get_previous_dump(pane))
-                for pane in self.active_window.panes }
+            changes = { pane:pane.screen.pop_changes() for pane in panes }
 
         self._invalidate_parts = 0
+        self._invalidated_panes = set()
 
         for r in self.renderers:
-            yield from r.repaint(parts, char_diffs)
-
-        # Apply diffs
-        for pane, diff in char_diffs.items():
-            for y, line_data in diff.items():
-                for x, char in line_data.items():
-                    self._last_char_buffers[pane][y][x] = char
+            yield from r.repaint(parts, changes)
 
         # Reschedule again, if something changed while rendering in the
         # meantime.
         self._invalidated = False
-        if self._invalidate_parts:
+        if self._invalidate_parts or self._invalidated_panes:
             self.invalidate(self._invalidate_parts)
 
     def add_renderer(self, renderer):
@@ -85,11 +167,30 @@ class Session:
         self.renderers.append(renderer)
         self.update_size()
 
+        if not self._clock_handle:
+            self._schedule_clock_tick()
+
     def remove_renderer(self, renderer):
         renderer.session = None
         self.renderers.remove(renderer)
         self.update_size()
 
+        # Nobody sees the clock anymore.
+        if not self.renderers:
+            self._stop_clock()
+
+    def close(self):
+        """
+        Remove all renderers and cancel the scheduled callbacks, so that the
+        event loop doesn't keep this session alive.
+        """
+        for renderer in list(self.renderers):
+            self.remove_renderer(renderer)
+
+        if self._repaint_handle:
+            self._repaint_handle.cancel()
+            self._repaint_handle = None
+
     @property
     def active_pane(self):
         """
@@ -109,6 +210,7 @@ class Session:
         window.session = weakref.ref(self)
 
         self.update_size()
+        self.status_bar.invalidate()
         self.invalidate(Redraw.All)
         return window
 
@@ -116,7 +218,13 @@ class Session:
         """
         Take the sizes of all the renderers, and scale the layout according to
         the smallest client.
+
+        (Renderers of which the size changed, or that were just added, draw
+        a full frame by themselves. Everything is only redrawn when the
+        layout size changes.)
         """
+        old_size = (self.sx, self.sy)
+
         sizes = [ r.get_size() for r in self.renderers ]
         if sizes:
             self.sx = min(s.x for s in sizes)
@@ -135,14 +243,28 @@ class Session:
             # Resize windows. (keep one line for the status bar.)
             window.layout.set_location(Location(0, 0, self.sx, self.sy - 1))
 
-        self.invalidate(Redraw.All)
+        if (self.sx, self.sy) != old_size:
+            self.invalidate(Redraw.All)
+        else:
+            self.invalidate(Redraw.Nothing)
 
     # Commands
 
     def send_input_to_current_pane(self, data):
+        self._last_input_time = loop.time()
+
         if self.active_pane:
-            logger.info('Sending %r' % b''.join(data))
-            self.active_pane.write_input(b''.join(data))
+            data = b''.join(data)
+            logger.info('Sending %i bytes' % len(data))
+            self.active_pane.write_input(data)
+
+    def send_paste_to_pane(self, pane, data):
+        """
+        Write pasted data to this pane, as it is. (It's not joined or copied
+        like the keyboard input.)
+        """
+        self._last_input_time = loop.time()
+        pane.write_input(data)
 
     def focus_next_window(self):
         if self.active_window and self.windows:
@@ -151,6 +273,7 @@ class Session:
             except ValueError:
                 index = 0
             self.active_window = self.windows[index % len(self.windows)]
+            self.status_bar.invalidate()
             self.invalidate(Redraw.All)
 
     def kill_current_pane(self):
@@ -164,4 +287,5 @@ class Session:
     def move_focus(self, direction='R'):
         self.active_window.move_focus(direction)
         self.invalidate(Redraw.Cursor | Redraw.Borders)
+        self.invalidate_status_bar()
 
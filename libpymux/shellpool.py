@@ -0,0 +1,121 @@
+"""
+Pool of panes of which the process is already running.
+
+Forking becomes slower when the multiplexer holds more memory, and a shell
+takes some time to start. A `ShellPool` keeps a few `ExecPane` instances
+ready, with their process started in advance, so that a new pane appears
+immediately. The pool is refilled in the background, one pane per event
+loop iteration. A process that terminates while it's waiting in the pool is
+reaped and replaced.
+"""
+from collections import deque
+import asyncio
+import functools
+import os
+import signal
+
+from .childwatcher import get_child_watcher
+from .log import logger
+
+
+class ShellPool:
+    """
+    :param pane_factory: Callable that returns a new `ExecPane`.
+    :param size: Number of panes to keep ready.
+    """
+    def __init__(self, pane_factory, size=4, loop=None):
+        self.pane_factory = pane_factory
+        self.size = size
+        self.loop = loop or asyncio.get_event_loop()
+
+        self._panes = deque()
+        self._exit_futures = {} # Maps pane to the future of its termination.
+        self._refill_handle = None
+        self._closed = False
+
+    def __len__(self):
+        return len(self._panes)
+
+    def start(self):
+        """ Fill the pool in the background. """
+        self._schedule_refill()
+
+    def get_pane(self):
+        """
+        Return a pane of which the process is running. When the pool is
+        empty, this returns a new pane. (The process is then forked when the
+        pane runs.)
+        """
+        pane = None
+
+        while self._panes and pane is None:
+            pane = self._panes.popleft()
+            future = self._exit_futures.pop(pane)
+
+            # Skip processes that terminated, also when the event loop didn't
+            # tell us yet.
+            if future.done() or get_child_watcher().poll(pane.process_id):
+                self._close_pane(pane)
+                pane = None
+
+        if pane is None:
+            pane = self.pane_factory()
+
+        self._schedule_refill()
+        return pane
+
+    def close(self):
+        """ Kill the processes in the pool. """
+        self._closed = True
+
+        if self._refill_handle:
+            self._refill_handle.cancel()
+            self._refill_handle = None
+
+        # (The processes are still reaped by the child watcher.)
+        self._exit_futures = {}
+
+        while self._panes:
+            pane = self._panes.popleft()
+            try:
+                pane.kill_process(signal.SIGHUP)
+            except OSError:
+                pass
+
+            self._close_pane(pane)
+
+    def _close_pane(self, pane):
+        """ Release the pseudo terminal of a pane that leaves the pool. """
+        os.close(pane.master)
+        os.close(pane.slave)
+
+    def _on_exit(self, pane, future):
+        """ A process terminated. Replace it, if it was still in the pool. """
+        if self._exit_futures.pop(pane, None) is None:
+            return # Handed out by `get_pane`, or the pool was closed.
+
+        logger.info('Process %r in the shell pool terminated' % pane.process_id)
+        self._panes.remove(pane)
+        self._close_pane(pane)
+        self._schedule_refill()
+
+    def _schedule_refill(self):
+        if not self._refill_handle and not self._closed and len(self._panes) < self.size:
+            self._refill_handle = self.loop.call_soon(self._refill)
+
+    def _refill(self):
+        """ Start one new pane, and reschedule when the pool isn't full yet. """
+        self._refill_handle = None
+
+        if len(self._panes) < self.size and not self._closed:
+            pane = self.pane_factory()
+            pane.start_process()
+            logger.info('Added process %r to the shell pool' % pane.process_id)
+
+            # Reap the process when it terminates in the pool.
+            future = get_child_watcher().wait(pane.process_id)
+            future.add_done_callback(functools.partial(self._on_exit, pane))
+            self._exit_futures[pane] = future
+
+            self._panes.append(pane)
+            self._schedule_refill()
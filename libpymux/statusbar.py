@@ -2,15 +2,40 @@ import datetime
 
 
 class StatusBar:
+    """
+    The status bar content. Both texts are cached: the left text until the
+    window list or the active panes change (see `invalidate`), the right text
+    (the clock) until the next `tick`.
+    """
+    # Interval between two clock ticks, in seconds.
+    clock_interval = 1
+
     def __init__(self, get_client_func):
         self._get_client_func = get_client_func
+        self._left_text = None
+        self._right_text = None
+
+    def invalidate(self):
+        """ Called when the window list or an active pane changes. """
+        self._left_text = None
+
+    def tick(self):
+        """ Called every `clock_interval` seconds. Update the clock. """
+        self._right_text = None
 
     @property
     def right_text(self):
-        return datetime.datetime.now().isoformat()
+        if self._right_text is None:
+            self._right_text = datetime.datetime.now().replace(microsecond=0).isoformat()
+        return self._right_text
 
     @property
     def left_text(self):
+        if self._left_text is None:
+            self._left_text = self._get_left_text()
+        return self._left_text
+
+    def _get_left_text(self):
         result = ['pymux']
         client = self._get_client_func()
 
@@ -0,0 +1,58 @@
+"""
+Custom `Stream` class for the `pyte` library.
+
+The original `Stream` dispatches a `draw` event for every single printable
+character. `BetterStream` detects runs of printable text between control
+characters and escape sequences, and hands them to the screen in one
+`draw_string` call.
+"""
+from pyte import control as ctrl
+import pyte
+import re
+
+
+class BetterStream(pyte.Stream):
+    # Characters that can't be part of a run of text when we are in the
+    # "stream" state. (Everything else is passed to `draw`.)
+    special_characters = set(pyte.Stream.basic) | set([
+        ctrl.ESC, ctrl.CSI, ctrl.NUL, ctrl.DEL])
+
+    _text_run = re.compile('[^%s]+' % re.escape(''.join(sorted(special_characters))))
+
+    def _supports_draw_string(self):
+        """
+        True when all the listeners accept `draw_string` events.
+        """
+        for listener, only in self.listeners:
+            if not hasattr(listener, 'draw_string'):
+                return False
+            if only and 'draw_string' not in only:
+                return False
+        return True
+
+    def feed(self, chars):
+        """
+        Consume a string. Runs of printable text are dispatched at once.
+        """
+        if not isinstance(chars, str):
+            raise TypeError("%s requires str input" % self.__class__.__name__)
+
+        if not self._supports_draw_string():
+            return super().feed(chars)
+
+        match_text = self._text_run.match
+        consume = self.consume
+        dispatch = self.dispatch
+        i = 0
+        length = len(chars)
+
+        while i < length:
+            if self.state == 'stream':
+                m = match_text(chars, i)
+                if m:
+                    dispatch('draw_string', m.group())
+                    i = m.end()
+                    continue
+
+            consume(chars[i])
+            i += 1
@@ -1,6 +1,7 @@
 import array
 import asyncio
 import fcntl
+import os
 import signal
 import termios
 
@@ -43,6 +44,19 @@ def set_size(stdout_fileno, rows, cols):
     fcntl.ioctl(stdout_fileno, termios.TIOCSWINSZ, buf)
 
 
+def has_terminal_capability(name):
+    """
+    True when the terminfo entry of the terminal ($TERM) has this string
+    capability. False when the terminal type is unknown.
+    """
+    try:
+        import curses
+        curses.setupterm(os.environ.get('TERM', 'dumb'), 1)
+        return curses.tigetstr(name) is not None
+    except (ImportError, curses.error):
+        return False
+
+
 def alternate_screen(write):
     class Context:
         def __enter__(self):
@@ -56,6 +70,17 @@ def alternate_screen(write):
     return Context()
 
 
+def bracketed_paste(write):
+    class Context:
+        def __enter__(self):
+            # Ask the terminal to mark pasted text.
+            write(b'\033[?2004h')
+
+        def __exit__(self, *a):
+            write(b'\033[?2004l')
+    return Context()
+
+
 def call_on_sigwinch(callback, loop=None):
     """
     Set a function to be called when the SIGWINCH signal is received.
@@ -15,6 +15,10 @@ class Window:
 
         self.session = None # Weakref to session added by session.add_window
 
+        # Cached result of `get_border_map`.
+        self._border_map = None
+        self._border_map_size = None
+
     @classmethod
     def _next_id(cls):
         cls._counter += 1
@@ -26,6 +30,64 @@ class Window:
             if session.active_window == self:
                 session.invalidate(*a)
 
+    def invalidate_pane(self, pane):
+        session = self.session()
+        if session:
+            if session.active_window == self:
+                session.invalidate_pane(pane)
+
+    def invalidate_status_bar(self):
+        """ Called when the active pane or its process changes. """
+        session = self.session()
+        if session:
+            session.invalidate_status_bar()
+
+    def invalidate_border_map(self):
+        """ Called when the layout changes. """
+        self._border_map = None
+
+    def get_border_map(self, width, height):
+        """
+        Return the borders between the panes of this window, as a list of
+        (x, y, cells) runs of adjacent border cells on the same line. Every
+        cell is a (border_type, panes) tuple, where `panes` are the panes
+        that this border cell belongs to.
+
+        The result is cached until the layout changes.
+        """
+        if self._border_map is None or self._border_map_size != (width, height):
+            self._border_map = self._create_border_map(width, height)
+            self._border_map_size = (width, height)
+
+        return self._border_map
+
+    def _create_border_map(self, width, height):
+        # Combine the border types of all the panes around every cell.
+        cells = {}
+
+        for pane in self.panes:
+            for x, y in pane.get_border_cells():
+                if 0 <= x < width and 0 <= y < height:
+                    border_type = pane._get_border_type(x, y)
+
+                    if border_type:
+                        mask, panes = cells.get((y, x), (0, ()))
+                        cells[y, x] = (mask | border_type, panes + (pane, ))
+
+        # Group into runs.
+        result = []
+        last_y, last_x = None, None
+
+        for y, x in sorted(cells):
+            if y != last_y or x != last_x + 1:
+                run = []
+                result.append((x, y, run))
+
+            run.append(cells[y, x])
+            last_y, last_x = y, x
+
+        return result
+
     def add_pane(self, pane, vsplit=False):
         """
         Split the current window and add this pane to the layout.
@@ -44,6 +106,7 @@ class Window:
         self.panes.append(pane)
         assert self.active_pane.parent, 'no active pane parent'
         self.invalidate(Redraw.All)
+        self.invalidate_status_bar()
 
         return pane
 
@@ -60,6 +123,8 @@ class Window:
         self.panes.remove(pane)
         pane.parent.remove(pane)
         pane.window = None
+        pane.close_writers()
+        self.invalidate_border_map()
 
     def focus_next(self):
         if self.active_pane:
@@ -71,6 +136,7 @@ class Window:
                     index = 0
                 self.active_pane = panes[index % len(panes)]
                 self.invalidate(Redraw.Cursor | Redraw.Borders)
+                self.invalidate_status_bar()
 
     def move_focus(self, direction):
         """
@@ -0,0 +1,69 @@
+"""
+Reference terminal for the renderer tests.
+
+A `pyte.Screen` that also understands the sequences that the renderer emits,
+but that `pyte` doesn't know: REP, SU/SD and resetting the scroll region.
+"""
+from pyte.screens import Margins
+import pyte
+
+
+class ReferenceScreen(pyte.Screen):
+    last_char = ' '
+
+    def set_margins(self, top=None, bottom=None):
+        if top is None or bottom is None:
+            # CSI r: reset the scroll region.
+            self.margins = Margins(0, self.lines - 1)
+            self.cursor_position()
+        else:
+            super().set_margins(top, bottom)
+
+    def draw(self, char):
+        self.last_char = char
+        super().draw(char)
+
+    def repeat(self, count=None):
+        for i in range(count or 1):
+            self.draw(self.last_char)
+
+    def scroll_up(self, count=None):
+        top, bottom = self.margins
+        for i in range(count or 1):
+            self.buffer.pop(top)
+            self.buffer.insert(bottom, [self.default_char] * self.columns)
+
+    def scroll_down(self, count=None):
+        top, bottom = self.margins
+        for i in range(count or 1):
+            self.buffer.pop(bottom)
+            self.buffer.insert(top, [self.default_char] * self.columns)
+
+    def __before__(self, command):
+        pass
+
+    def __after__(self, command):
+        pass
+
+
+class ReferenceStream(pyte.Stream):
+    csi = dict(pyte.Stream.csi, b='repeat', S='scroll_up', T='scroll_down')
+
+
+class ReferenceTerminal:
+    """
+    Terminal of a client. Feed it the output of a renderer.
+    """
+    def __init__(self, width, height):
+        self.screen = ReferenceScreen(width, height)
+        self.screen.set_mode(pyte.modes.DECAWM)
+        self.stream = ReferenceStream()
+        self.stream.attach(self.screen)
+
+    def feed(self, data):
+        self.stream.feed(bytes(data).decode('utf-8'))
+
+    def get_text(self, x, y, width, height):
+        """ The text in this rectangle, as a list of lines. """
+        return [''.join(char.data for char in line[x:x + width])
+                for line in self.screen.buffer[y:y + height]]
@@ -0,0 +1,62 @@
+from libpymux.childwatcher import ChildWatcher
+
+import asyncio
+import os
+import signal
+import time
+import unittest
+
+
+class ChildWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def fork(self, exit_code):
+        pid = os.fork()
+        if pid == 0:
+            os._exit(exit_code)
+        return pid
+
+    def test_wait(self):
+        watcher = ChildWatcher()
+        pid = self.fork(3)
+
+        status = self.loop.run_until_complete(asyncio.wait_for(watcher.wait(pid), 5))
+        self.assertEqual(status, 3 << 8)
+
+    def test_fallback_leaves_asyncio_subprocesses_alone(self):
+        asyncio.get_child_watcher()
+
+        watcher = ChildWatcher()
+        watcher.use_pidfd = False
+        pid = self.fork(3)
+
+        @asyncio.coroutine
+        def run():
+            future = watcher.wait(pid)
+            process = yield from asyncio.create_subprocess_exec('true')
+            returncode = yield from process.wait()
+            status = yield from future
+            return returncode, status
+
+        result = self.loop.run_until_complete(asyncio.wait_for(run(), 5))
+        self.assertEqual(result, (0, 3 << 8))
+
+    def test_poll(self):
+        watcher = ChildWatcher()
+        pid = os.fork()
+        if pid == 0:
+            time.sleep(60)
+            os._exit(0)
+
+        future = watcher.wait(pid)
+        self.assertFalse(watcher.poll(pid))
+
+        os.kill(pid, signal.SIGKILL)
+        status = self.loop.run_until_complete(asyncio.wait_for(future, 5))
+
+        self.assertEqual(status, signal.SIGKILL)
+        self.assertTrue(watcher.poll(pid))
+
+if __name__ == '__main__':
+    unittest.main()
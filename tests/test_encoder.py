@@ -0,0 +1,105 @@
+from libpymux.renderer import OutputEncoder
+from libpymux.screen import styles, Cell
+from pyte.screens import Char
+
+import unittest
+
+
+default = styles.get_id(Char(' '))
+bold_red = styles.get_id(Char(' ', fg='red', bold=True))
+blue_background = styles.get_id(Char(' ', bg='blue'))
+
+
+class CursorMovementTest(unittest.TestCase):
+    def setUp(self):
+        self.encoder = OutputEncoder(80)
+
+    def move(self, row, col):
+        self.encoder.data = bytearray()
+        self.encoder.move_to(row, col)
+        return bytes(self.encoder.data)
+
+    def test_absolute_position(self):
+        self.assertEqual(self.move(2, 4), b'\033[3;5H')
+        self.assertEqual(self.move(9, 0), b'\033[10H')
+
+    def test_relative_movements(self):
+        self.move(2, 4)
+        self.assertEqual(self.move(2, 4), b'')
+        self.assertEqual(self.move(2, 8), b'\033[9G')
+        self.assertEqual(self.move(2, 7), b'\033[D')
+        self.assertEqual(self.move(2, 12), b'\033[5C')
+        self.assertEqual(self.move(3, 0), b'\r\n')
+        self.assertEqual(self.move(3, 5), b'\033[6G')
+        self.assertEqual(self.move(1, 5), b'\033[2A')
+        self.assertEqual(self.move(1, 0), b'\r')
+        self.assertEqual(self.move(4, 0), b'\033[5H') # (Relative isn't shorter.)
+
+
+class StyleTransitionTest(unittest.TestCase):
+    def transition(self, old, new):
+        encoder = OutputEncoder(80, style=old)
+        encoder.set_style(new)
+        return bytes(encoder.data)
+
+    def test_same_style(self):
+        self.assertEqual(self.transition(bold_red, bold_red), b'')
+
+    def test_only_changes(self):
+        self.assertEqual(self.transition(default, bold_red), b'\033[1;31m')
+        self.assertEqual(self.transition(default, blue_background), b'\033[44m')
+
+    def test_reset_when_shorter(self):
+        self.assertEqual(self.transition(bold_red, default), b'\033[0m')
+        self.assertEqual(self.transition(bold_red, blue_background), b'\033[0;44m')
+
+
+class WriteCellsTest(unittest.TestCase):
+    def write(self, cell, count, col=0, **options):
+        encoder = OutputEncoder(80, **options)
+        encoder.move_to(0, col)
+        encoder.data = bytearray()
+        encoder.write_cells(0, col, cell, count)
+        return bytes(encoder.data), encoder
+
+    def test_repeat(self):
+        data, encoder = self.write(Cell('x', default), 10, use_rep=True)
+        self.assertEqual(data, b'x\033[9b')
+        self.assertEqual(encoder.col, 10)
+
+    def test_no_erase_for_short_runs(self):
+        # Moving over the erased blanks would cost more.
+        data, encoder = self.write(Cell(' ', default), 10, col=5)
+        self.assertEqual(data, b' ' * 10)
+
+    def test_no_repeat_for_short_runs(self):
+        data, encoder = self.write(Cell('x', default), 3, use_rep=True)
+        self.assertEqual(data, b'xxx')
+
+    def test_repeat_is_off_by_default(self):
+        data, encoder = self.write(Cell('x', default), 10)
+        self.assertEqual(data, b'x' * 10)
+
+    def test_erase_characters(self):
+        data, encoder = self.write(Cell(' ', default), 20, col=5)
+        self.assertEqual(data, b'\033[20X')
+        self.assertEqual(encoder.col, 5)
+
+    def test_erase_to_end_of_line(self):
+        data, encoder = self.write(Cell(' ', default), 75, col=5)
+        self.assertEqual(data, b'\033[K')
+
+    def test_no_erase_with_background(self):
+        data, encoder = self.write(Cell(' ', blue_background), 10, col=5)
+        self.assertEqual(data, b'\033[44m' + b' ' * 10)
+
+        data, encoder = self.write(Cell(' ', default), 10, col=5, use_erase=False)
+        self.assertEqual(data, b' ' * 10)
+
+    def test_cursor_unknown_after_last_column(self):
+        data, encoder = self.write(Cell('x', default), 5, col=75)
+        self.assertEqual(encoder.col, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+from libpymux.input import InputProtocol, PASTE_START, PASTE_END
+
+import unittest
+
+
+class Pane:
+    def __init__(self, bracketed_paste=False):
+        self.bracketed_paste = bracketed_paste
+        self.received = []
+
+    def write_input(self, data):
+        self.received.append(bytes(data))
+
+
+class Session:
+    def __init__(self, pane):
+        self.active_pane = pane
+        self.paste_writes = 0
+
+    def send_input_to_current_pane(self, data):
+        self.active_pane.write_input(b''.join(data))
+
+    def send_paste_to_pane(self, pane, data):
+        self.paste_writes += 1
+        pane.write_input(data)
+
+
+class RecordingInputProtocol(InputProtocol):
+    def __init__(self, session):
+        self.calls = []
+        super().__init__(session)
+
+    def get_bindings(self):
+        return {
+            b'x': lambda: self.calls.append('x'),
+        }
+
+
+class ArrowBindingInputProtocol(RecordingInputProtocol):
+    def get_bindings(self):
+        return {
+            b'x': lambda: self.calls.append('x'),
+            b'\x1b[A': lambda: self.calls.append('up'),
+            b'\x1b': lambda: self.calls.append('escape'),
+        }
+
+
+class KeyBindingTest(unittest.TestCase):
+    def feed(self, chunks, protocol_class=RecordingInputProtocol):
+        pane = Pane()
+        protocol = protocol_class(Session(pane))
+
+        for chunk in chunks:
+            protocol.data_received(chunk)
+
+        return protocol, b''.join(pane.received)
+
+    def test_binding(self):
+        protocol, received = self.feed([b'a\x01xb'])
+
+        self.assertEqual(protocol.calls, ['x'])
+        self.assertEqual(received, b'ab')
+
+    def test_unbound_key_is_dropped(self):
+        protocol, received = self.feed([b'a\x01yb'])
+
+        self.assertEqual(protocol.calls, [])
+        self.assertEqual(received, b'ab')
+
+    def test_unbound_escape_sequence_is_dropped(self):
+        for key in [b'\x1b[A', b'\x1b[1;5C', b'\x1bOP', b'\x1bx', '\xe9'.encode('utf-8')]:
+            data = b'a\x01' + key + b'b'
+
+            # In one chunk, and split at every offset.
+            for offset in range(len(data) + 1):
+                protocol, received = self.feed([data[:offset], data[offset:]])
+
+                self.assertEqual(protocol.calls, [], (key, offset))
+                self.assertEqual(received, b'ab', (key, offset))
+
+    def test_unbound_escape_sequence_with_bound_prefix(self):
+        data = b'a\x01\x1b[Bb\x01\x1b[A'
+
+        for offset in range(len(data) + 1):
+            protocol, received = self.feed([data[:offset], data[offset:]], ArrowBindingInputProtocol)
+
+            self.assertEqual(protocol.calls, ['up'], offset)
+            self.assertEqual(received, b'ab', offset)
+
+    def test_shorter_binding(self):
+        protocol, received = self.feed([b'\x01\x1bxb'], ArrowBindingInputProtocol)
+
+        self.assertEqual(protocol.calls, ['escape'])
+        self.assertEqual(received, b'xb')
+
+
+class BracketedPasteTest(unittest.TestCase):
+    def feed(self, chunks, bracketed_paste=False):
+        pane = Pane(bracketed_paste)
+        protocol = RecordingInputProtocol(Session(pane))
+
+        for chunk in chunks:
+            protocol.data_received(chunk)
+
+        return protocol, b''.join(pane.received)
+
+    def test_bindings_are_ignored_in_paste(self):
+        protocol, received = self.feed([b'a' + PASTE_START + b'pa\x01xste' + PASTE_END + b'b'])
+
+        self.assertEqual(protocol.calls, [])
+        self.assertEqual(received, b'apa\x01xsteb')
+
+    def test_split_start_sequence(self):
+        data = b'a' + PASTE_START + b'pa\x01xste' + PASTE_END + b'b'
+
+        for offset in range(1, len(PASTE_START) + 2):
+            protocol, received = self.feed([data[:offset], data[offset:]])
+
+            self.assertEqual(protocol.calls, [], offset)
+            self.assertEqual(received, b'apa\x01xsteb', offset)
+
+    def test_split_end_sequence(self):
+        data = b'a' + PASTE_START + b'pa\x01xste' + PASTE_END + b'b'
+        start = data.index(PASTE_END)
+
+        for offset in range(start + 1, start + len(PASTE_END)):
+            protocol, received = self.feed([data[:offset], data[offset:]])
+
+            self.assertEqual(protocol.calls, [], offset)
+            self.assertEqual(received, b'apa\x01xsteb', offset)
+
+    def test_paste_goes_through_session(self):
+        protocol, received = self.feed([PASTE_START + b'paste' + PASTE_END])
+        self.assertEqual(protocol.session.paste_writes, 1)
+
+    def test_rewrap_for_bracketed_paste_application(self):
+        protocol, received = self.feed([b'a' + PASTE_START + b'paste' + PASTE_END],
+                                       bracketed_paste=True)
+
+        self.assertEqual(received, b'a' + PASTE_START + b'paste' + PASTE_END)
+
+    def test_lone_escape_is_sent_after_timeout(self):
+        protocol, received = self.feed([b'\x1b'])
+        self.assertEqual(received, b'')
+
+        protocol._on_timeout()
+        self.assertEqual(b''.join(protocol.session.active_pane.received), b'\x1b')
+
+
+if __name__ == '__main__':
+    unittest.main()
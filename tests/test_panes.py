@@ -0,0 +1,60 @@
+from libpymux.panes import Pane
+
+import asyncio
+import unittest
+
+
+class OutputPane(Pane):
+    process_id = None
+
+
+class ReadTransport:
+    def __init__(self):
+        self.paused = False
+        self.pause_count = 0
+
+    def pause_reading(self):
+        self.paused = True
+        self.pause_count += 1
+
+    def resume_reading(self):
+        self.paused = False
+
+
+class FloodControlTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.pane = OutputPane()
+        self.pane.window = lambda: None
+        self.transport = ReadTransport()
+
+    def tearDown(self):
+        self.pane.close_writers()
+
+    def test_reading_pauses_and_resumes(self):
+        self.pane.flood_time_limit = 0 # Any output is too slow.
+
+        self.pane._process_output('line\r\n', self.transport)
+        self.pane._process_output('line\r\n', self.transport)
+
+        self.assertTrue(self.transport.paused)
+        self.assertEqual(self.transport.pause_count, 1)
+        self.assertEqual(self.pane.paused_reads, 1)
+        self.assertEqual(self.pane.deferred_frames, 2)
+
+        self.loop.run_until_complete(asyncio.sleep(self.pane.flood_interval * 2))
+        self.assertFalse(self.transport.paused)
+
+    def test_no_limit_on_the_amount_of_output(self):
+        self.pane.flood_time_limit = 60
+
+        # (More than the 64K characters that used to be the limit.)
+        for i in range(20):
+            self.pane._process_output('x' * 8192, self.transport)
+
+        self.assertEqual(self.transport.pause_count, 0)
+        self.assertEqual(self.pane.deferred_frames, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+from libpymux.panes import Pane
+from libpymux.ptywriter import PtyWriter
+
+import asyncio
+import fcntl
+import os
+import unittest
+
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+
+
+class OutputPane(Pane):
+    process_id = None
+
+
+class PtyWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.read_fd, self.write_fd = os.pipe()
+        fcntl.fcntl(self.write_fd, F_SETPIPE_SZ, 4096)
+
+        self.writer = PtyWriter(self.write_fd)
+        self.writer.high_watermark = 8192
+        self.writer.low_watermark = 1024
+        self.received = bytearray()
+
+    def tearDown(self):
+        self.writer.close()
+        self.loop.remove_reader(self.read_fd)
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+    def start_reading(self):
+        def read():
+            self.received += os.read(self.read_fd, 1024)
+        self.loop.add_reader(self.read_fd, read)
+
+    def run_loop(self, delay=.1):
+        self.loop.run_until_complete(asyncio.sleep(delay))
+
+    def test_partial_write_is_buffered_and_flushed(self):
+        data = bytes(range(256)) * 40
+        self.writer.write(data)
+        self.writer.write(b'end')
+
+        self.assertEqual(self.writer.buffered_bytes, len(data) + 3 - 4096)
+
+        self.start_reading()
+        self.run_loop()
+
+        self.assertEqual(self.writer.buffered_bytes, 0)
+        self.assertEqual(self.received, data + b'end')
+
+    def test_drain(self):
+        self.writer.write(b'x' * 20000)
+        self.assertTrue(self.writer.paused)
+
+        drain = asyncio.ensure_future(self.writer.drain())
+        self.run_loop(.05)
+        self.assertFalse(drain.done())
+
+        self.start_reading()
+        self.loop.run_until_complete(asyncio.wait_for(drain, 5))
+
+        self.assertFalse(self.writer.paused)
+        self.assertLessEqual(self.writer.buffered_bytes, self.writer.low_watermark)
+
+    def test_max_buffer_size(self):
+        self.writer.max_buffer_size = 1000
+        self.writer.write(b'x' * 6000)
+
+        self.assertEqual(self.writer.buffered_bytes, 1000)
+        self.assertEqual(self.writer.dropped_bytes, 6000 - 4096 - 1000)
+
+    def test_close(self):
+        self.writer.write(b'x' * 20000)
+        drain = asyncio.ensure_future(self.writer.drain())
+        self.writer.close()
+
+        self.assertEqual(self.writer.buffered_bytes, 0)
+        self.loop.run_until_complete(asyncio.wait_for(drain, 5))
+
+        # Writing after closing is ignored.
+        self.writer.write(b'y')
+        self.assertEqual(self.writer.buffered_bytes, 0)
+
+
+class CloseWritersTest(unittest.TestCase):
+    def test_close_writers(self):
+        pane = OutputPane()
+        pane.write(b'output')
+        pane.write_input(b'input')
+        fd = pane.output_writer.fd
+
+        pane.close_writers()
+        pane.close_writers()
+
+        self.assertRaises(OSError, os.fstat, fd)
+
+        # Writes are ignored from now on.
+        pane.write(b'output')
+        pane.write_input(b'input')
+        self.assertIs(pane.output_writer.fd, fd)
+
+        os.close(pane.master)
+        os.close(pane.slave)
+
+
+if __name__ == '__main__':
+    unittest.main()
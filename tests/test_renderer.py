@@ -0,0 +1,180 @@
+from libpymux.panes import Pane
+from libpymux.renderer import NullRenderer
+from libpymux.session import Session
+from libpymux.window import Window
+
+from .terminal import ReferenceTerminal
+
+import asyncio
+import unittest
+
+
+class OutputPane(Pane):
+    """ Pane without a process. The tests feed its stream. """
+    process_id = None
+
+
+class RecordingRenderer(NullRenderer):
+    """ Renderer that sends its output to a reference terminal. """
+    def __init__(self, width, height):
+        super().__init__(width, height)
+        self.terminal = ReferenceTerminal(width, height)
+        self.output = bytearray()
+
+    @asyncio.coroutine
+    def _write_output(self, data):
+        yield from super()._write_output(data)
+        self.output += data
+        self.terminal.feed(data)
+
+
+def pane_text(pane):
+    """ The visible text of a pane, as a list of lines. """
+    dump = pane.screen.dump_character_diff(None)
+    return [''.join(dump[y][x].data for x in range(pane.sx)) for y in range(pane.sy)]
+
+
+class RendererTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.session = Session()
+        self.renderer = RecordingRenderer(20, 6)
+        self.session.add_renderer(self.renderer)
+
+        self.window = Window()
+        self.session.add_window(self.window)
+        self.pane = OutputPane()
+        self.window.add_pane(self.pane)
+
+    def tearDown(self):
+        for renderer in list(self.session.renderers):
+            self.session.remove_renderer(renderer)
+
+    def feed(self, text, pane=None):
+        pane = pane or self.pane
+        pane.stream.feed(text)
+        self.session.invalidate_pane(pane)
+
+    def repaint(self):
+        """ Render a frame, and return what the renderer wrote. """
+        self.renderer.output = bytearray()
+        self.loop.run_until_complete(self.session.repaint())
+        return bytes(self.renderer.output)
+
+    def assertClientShows(self, pane, renderer=None):
+        renderer = renderer or self.renderer
+        self.assertEqual(
+            renderer.terminal.get_text(pane.px, pane.py, pane.sx, pane.sy),
+            pane_text(pane))
+
+
+class ScrollTest(RendererTestCase):
+    def test_full_width_pane_scrolls_terminal(self):
+        self.feed('\r\n'.join('line %i' % i for i in range(5)))
+        self.repaint()
+
+        self.feed('\r\nnew 1\r\nnew 2')
+        output = self.repaint()
+
+        self.assertIn(b'\033[1;5r\033[2S', output)
+        self.assertIn(b'\033[r', output)
+        self.assertClientShows(self.pane)
+
+    def test_reverse_index_scrolls_down(self):
+        self.feed('\r\n'.join('line %i' % i for i in range(5)))
+        self.repaint()
+
+        self.feed('\033[H\033Mtop')
+        output = self.repaint()
+
+        self.assertIn(b'\033[1;5r\033[T', output)
+        self.assertClientShows(self.pane)
+
+    def test_wider_client_falls_back_to_diff(self):
+        wide = RecordingRenderer(30, 8)
+        self.session.add_renderer(wide)
+
+        self.feed('\r\n'.join('line %i' % i for i in range(5)))
+        self.repaint()
+        background = wide.terminal.get_text(20, 0, 10, 8)
+
+        self.feed('\r\nnew 1\r\nnew 2')
+        self.repaint()
+
+        self.assertNotIn(b'\033[1;5r', wide.output)
+        self.assertIn(b'\033[1;5r', self.renderer.output)
+        self.assertEqual(wide.terminal.get_text(20, 0, 10, 8), background)
+        self.assertClientShows(self.pane, wide)
+        self.assertClientShows(self.pane)
+
+    def test_narrow_pane_falls_back_to_diff(self):
+        other = OutputPane()
+        self.window.add_pane(other, vsplit=True)
+        self.assertLess(self.pane.sx, 20)
+
+        self.feed('\r\n'.join('line %i' % i for i in range(5)))
+        self.feed('right', other)
+        self.repaint()
+
+        self.feed('\r\nnew 1\r\nnew 2')
+        output = self.repaint()
+
+        self.assertNotIn(b'\033[1;5r', output)
+        self.assertClientShows(self.pane)
+        self.assertClientShows(other)
+
+
+class FlowControlTest(RendererTestCase):
+    def test_skipped_frames_are_merged(self):
+        self.feed('\r\n'.join('line %i' % i for i in range(5)))
+        self.repaint()
+
+        # The client is behind. Output, including scrolls, keeps arriving.
+        self.renderer.pause_writing()
+        self.feed('\r\nA')
+        self.assertEqual(self.repaint(), b'')
+        self.assertEqual(self.renderer.skipped_frames, 1)
+
+        # More output arrives while the client catches up.
+        self.feed('\r\nB')
+        self.renderer.resume_writing()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.repaint()
+
+        self.assertClientShows(self.pane)
+
+    def test_scrolls_in_both_directions(self):
+        self.feed('\r\n'.join('line %i' % i for i in range(5)))
+        self.repaint()
+
+        self.renderer.pause_writing()
+        self.feed('\r\nA')
+        self.repaint()
+        self.feed('\033[H\033Mtop\033[5;1H\r\nB')
+        self.repaint()
+
+        self.renderer.resume_writing()
+        self.feed('\r\nC')
+        self.loop.run_until_complete(asyncio.sleep(.1))
+
+        self.assertClientShows(self.pane)
+
+    def test_resume_schedules_frame(self):
+        self.feed('\r\n'.join('line %i' % i for i in range(5)))
+        self.repaint()
+
+        self.renderer.pause_writing()
+        self.feed('\r\nA\r\nB')
+        self.repaint()
+        frames = self.renderer.frames
+
+        self.renderer.resume_writing()
+        self.loop.run_until_complete(asyncio.sleep(.1))
+
+        # (The status bar clock could have caused another frame.)
+        self.assertGreater(self.renderer.frames, frames)
+        self.assertClientShows(self.pane)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+from libpymux.screen import BetterScreen
+from libpymux.stream import BetterStream
+
+import unittest
+
+
+class DeleteLinesTest(unittest.TestCase):
+    def setUp(self):
+        self.screen = BetterScreen(10, 20)
+        self.stream = BetterStream()
+        self.stream.attach(self.screen)
+
+        self.stream.feed('\r\n'.join('line %i' % i for i in range(10)))
+        self.screen.pop_changes()
+
+    def test_cursor_below_bottom_minus_count(self):
+        # Cursor at line 8, delete 4 lines: the loop writes lines 6-8.
+        self.stream.feed('\033[9;1H\033[4M')
+        changes = self.screen.pop_changes()
+
+        self.assertTrue(set(range(6, 10)) <= changes.lines)
+
+    def test_changed_lines_are_dirty(self):
+        before = self.screen.dump_character_diff(None)
+        self.stream.feed('\033[8;1H\033[3M')
+        changes = self.screen.pop_changes()
+        after = self.screen.dump_character_diff(None)
+
+        for y in range(self.screen.lines):
+            if before[y] != after[y]:
+                self.assertIn(y, changes.lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+from libpymux.renderer import NullRenderer
+from libpymux.session import Session
+
+import gc
+import unittest
+import weakref
+
+
+class ClockTest(unittest.TestCase):
+    def test_clock_runs_while_there_are_renderers(self):
+        session = Session()
+        self.assertIsNone(session._clock_handle)
+
+        renderer1 = NullRenderer()
+        renderer2 = NullRenderer()
+        session.add_renderer(renderer1)
+        session.add_renderer(renderer2)
+        handle = session._clock_handle
+        self.assertIsNotNone(handle)
+
+        session.remove_renderer(renderer1)
+        self.assertIs(session._clock_handle, handle)
+
+        session.remove_renderer(renderer2)
+        self.assertIsNone(session._clock_handle)
+        self.assertTrue(handle._cancelled)
+
+        session.close()
+
+    def test_closed_session_is_released(self):
+        session = Session()
+        session.add_renderer(NullRenderer())
+        session.close()
+
+        self.assertEqual(session.renderers, [])
+
+        ref = weakref.ref(session)
+        del session
+        gc.collect()
+        self.assertIsNone(ref())
+
+
+if __name__ == '__main__':
+    unittest.main()
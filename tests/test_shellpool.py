@@ -0,0 +1,78 @@
+from libpymux.panes import SpawnPane
+from libpymux.shellpool import ShellPool
+
+import asyncio
+import os
+import signal
+import unittest
+
+
+def is_running(pid):
+    """ True when this child didn't terminate. (Doesn't reap it.) """
+    return os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None
+
+
+def is_reaped(pid):
+    try:
+        os.waitpid(pid, os.WNOHANG)
+    except ChildProcessError:
+        return True
+    else:
+        return False
+
+
+class ShellPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.pool = ShellPool(lambda: SpawnPane(['sleep', '60']), size=2)
+        self.pool.start()
+        self.run_loop()
+        self.handed_out = []
+
+    def tearDown(self):
+        for pane in self.handed_out:
+            pane.kill_process()
+            os.close(pane.master)
+            os.close(pane.slave)
+
+        self.pool.close()
+        self.run_loop()
+
+    def run_loop(self, delay=.2):
+        self.loop.run_until_complete(asyncio.sleep(delay))
+
+    def get_pane(self):
+        pane = self.pool.get_pane()
+        self.handed_out.append(pane)
+        return pane
+
+    def test_terminated_process_is_replaced(self):
+        self.assertEqual(len(self.pool), 2)
+        pid = self.pool._panes[0].process_id
+
+        os.kill(pid, signal.SIGKILL)
+        self.run_loop()
+
+        self.assertTrue(is_reaped(pid))
+        self.assertEqual(len(self.pool), 2)
+
+        pane = self.get_pane()
+        self.assertNotEqual(pane.process_id, pid)
+        self.assertTrue(is_running(pane.process_id))
+
+    def test_get_pane_before_the_loop_noticed(self):
+        pid = self.pool._panes[0].process_id
+
+        os.kill(pid, signal.SIGKILL)
+        os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+
+        pane = self.get_pane()
+        self.assertNotEqual(pane.process_id, pid)
+        self.assertTrue(is_running(pane.process_id))
+
+        self.run_loop()
+        self.assertTrue(is_reaped(pid))
+
+
+if __name__ == '__main__':
+    unittest.main()